@@ -1,37 +1,84 @@
+import hashlib
+
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import AnonymousUser, User
 from django.contrib.sessions.models import Session
 
-@database_sync_to_async
-def get_user(token):
-    try:
-        return Token.objects.get(key=token).user
-    except Token.DoesNotExist:
-        return AnonymousUser()
+
+def _cache_key(credential: str) -> str:
+    return f"ws_auth:{hashlib.sha256(credential.encode()).hexdigest()}"
+
+
+def invalidate(*credentials):
+    """Forget the users cached for these tokens or session keys."""
+    keys = [_cache_key(credential) for credential in credentials if credential]
+    if keys:
+        cache.delete_many(keys)
+
+
+def _resolve_user(credential: str):
+    """
+    The user a token or session key belongs to, and how long that can be cached. Session keys are only cached
+    until the session expires.
+    """
+    timeout = settings.CONSURF_WS_AUTH_CACHE_TIMEOUT
+    token = Token.objects.select_related("user").filter(key=credential).first()
+    if token is not None:
+        return token.user, timeout
+    session = Session.objects.filter(session_key=credential, expire_date__gt=timezone.now()).first()
+    if session is not None:
+        user_id = session.get_decoded().get('_auth_user_id')
+        user = User.objects.filter(pk=user_id).first() if user_id else None
+        if user is not None:
+            remaining = (session.expire_date - timezone.now()).total_seconds()
+            return user, max(1, min(timeout, int(remaining)))
+    return AnonymousUser(), timeout
+
 
 @database_sync_to_async
-def get_user_by_session_id(session_id):
-    try:
-        session = Session.objects.get(session_key=session_id)
-        uid = session.get_decoded().get('_auth_user_id')
-        return User.objects.get(pk=uid)
-    except (Session.DoesNotExist, User.DoesNotExist):
+def get_user(credential: str | None):
+    """
+    The user of a token, or of a session key when it is not a token. The user id is cached for
+    CONSURF_WS_AUTH_CACHE_TIMEOUT seconds so that reconnects only cost a primary key lookup.
+    """
+    if not credential:
+        return AnonymousUser()
+    key = _cache_key(credential)
+    user_id = cache.get(key)
+    if user_id == 0:
         return AnonymousUser()
+    if user_id is not None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            return user
+    user, timeout = _resolve_user(credential)
+    cache.set(key, user.pk or 0, timeout)
+    return user
+
+
+def _query_param(query_string: bytes, name: bytes) -> str | None:
+    """The value of one query string parameter, found without splitting the whole query string."""
+    prefix = name + b"="
+    index = query_string.find(prefix)
+    while index != -1:
+        if index == 0 or query_string[index - 1] == 38:  # &
+            start = index + len(prefix)
+            end = query_string.find(b"&", start)
+            return query_string[start:end if end != -1 else len(query_string)].decode(errors="replace")
+        index = query_string.find(prefix, index + 1)
+    return None
+
 
 class TokenAuthMiddleware(BaseMiddleware):
     def __init__(self, inner):
         super().__init__(inner)
 
     async def __call__(self, scope, receive, send):
-        try:
-            token_key = (dict((x.split('=') for x in scope['query_string'].decode().split("&")))).get('token', None)
-        except ValueError:
-            token_key = None
-        scope['user'] = AnonymousUser() if token_key is None else await get_user(token_key)
-        # if scope['user'] is AnonymousUser() try using token_key with get_user_by_session_id
-        if isinstance(scope['user'], AnonymousUser):
-            scope['user'] = await get_user_by_session_id(token_key)
-
-        return await super().__call__(scope, receive, send)
\ No newline at end of file
+        # token is either an auth token or a session key
+        scope['user'] = await get_user(_query_param(scope.get('query_string', b''), b'token'))
+        return await super().__call__(scope, receive, send)
@@ -1,9 +1,24 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from ct import job_events, job_logs
+
 
 class JobConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
         self.session_id = self.scope['url_route']['kwargs']['session_id']
+        # the last event replayed for each job, live messages up to it were already sent
+        self.replayed = {}
+        # group messages are held for CONSURF_WS_COALESCE_WINDOW seconds and merged before they are sent
+        self.coalescer = job_events.MessageCoalescer()
+        self.flush_task = None
+        self.send_lock = asyncio.Lock()
+        self.broadcast_limiter = job_events.RateLimiter(settings.CONSURF_WS_BROADCAST_RATE,
+                                                        settings.CONSURF_WS_BROADCAST_BURST)
         user = self.scope['user']
         await self.channel_layer.group_add(
             "job_" + self.session_id,
@@ -16,12 +31,26 @@ class JobConsumer(AsyncJsonWebsocketConsumer):
         })
 
     async def disconnect(self, close_code):
+        if getattr(self, "flush_task", None):
+            self.flush_task.cancel()
         await self.channel_layer.group_discard(
             "job_" + self.session_id,
             self.channel_name
         )
 
     async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get("type") == "resync":
+            await self.resync(content)
+            return
+        if isinstance(content, dict) and content.get("type") == "replay":
+            await self.replay(content)
+            return
+        # anything else a client sends goes to the whole session, within a per connection rate
+        if settings.CONSURF_WS_BROADCAST_RATE <= 0 or not self.broadcast_limiter.allow():
+            job_events.count("dropped_broadcasts")
+            await self.send_json({"type": "error", "content": "Broadcast rate limit exceeded"})
+            return
+        job_events.count("broadcasts")
         await self.channel_layer.group_send(
             "job_" + self.session_id,
             {
@@ -31,5 +60,66 @@ class JobConsumer(AsyncJsonWebsocketConsumer):
         )
 
     async def job_message(self, event):
-        await self.send_json(event["message"])
+        self.coalescer.add(event["message"])
+        if settings.CONSURF_WS_COALESCE_WINDOW <= 0:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.CONSURF_WS_COALESCE_WINDOW)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.send_lock:
+            for message in self.coalescer.drain():
+                if not self.was_replayed(message):
+                    await self.send_json(message)
+
+    def was_replayed(self, message) -> bool:
+        replayed = self.replayed.get(message.get("job_id")) if isinstance(message, dict) else None
+        return bool(replayed and message.get("event_id") and job_events.event_key(message["event_id"]) <= replayed)
+
+    async def resync(self, content):
+        """
+        Answer {"type": "resync", "job_id": ..., "offsets": {"stdout": ..., "stderr": ...}} with a log_snapshot of
+        the job logs from those byte offsets, sent to this client only.
+        """
+        consurf_job = await database_sync_to_async(job_logs.job_for_resync)(
+            content.get("job_id"), self.scope["user"], self.session_id)
+        if consurf_job is None:
+            await self.send_json({"type": "error", "job_id": content.get("job_id"), "content": "Job not found"})
+            return
+        offsets = content.get("offsets")
+        await self.send_json(await database_sync_to_async(job_logs.snapshot_message)(
+            consurf_job, offsets if isinstance(offsets, dict) else {}, settings.CONSURF_JOB_LOG_SNAPSHOT_SIZE))
 
+    async def replay(self, content):
+        """
+        Answer {"type": "replay", "job_id": ..., "last_event_id": ...} with the stored events of the job after
+        last_event_id, or all of them without it, each as it was first sent, then a replay_complete message. gap is
+        true when events may be missing, the client then resyncs the logs instead. Group messages wait until the
+        replay is over and those already replayed are skipped, also when they were held for coalescing.
+        """
+        job_id = content.get("job_id")
+        consurf_job = await database_sync_to_async(job_logs.job_for_resync)(job_id, self.scope["user"],
+                                                                           self.session_id)
+        if consurf_job is None:
+            await self.send_json({"type": "error", "job_id": job_id, "content": "Job not found"})
+            return
+        last_event_id = content.get("last_event_id") or None
+        try:
+            events, gap = await sync_to_async(job_events.replay, thread_sensitive=False)(consurf_job.id,
+                                                                                         last_event_id)
+        except ValueError:
+            await self.send_json({"type": "error", "job_id": consurf_job.id, "content": "Invalid last_event_id"})
+            return
+        async with self.send_lock:
+            for message in events:
+                await self.send_json(message)
+            last_event_id = events[-1]["event_id"] if events else last_event_id
+            if last_event_id:
+                self.replayed[consurf_job.id] = job_events.event_key(last_event_id)
+            await self.send_json({"type": "replay_complete", "job_id": consurf_job.id,
+                                  "status": consurf_job.status, "last_event_id": last_event_id, "gap": gap})
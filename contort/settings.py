@@ -237,6 +237,33 @@ CACHES = {
         }
     }
 }
+CONSURF_GRADE_PARSER_ENGINES = {
+    "webserver": os.environ.get("CONSURF_GRADE_PARSER_WEBSERVER", "vectorized"),
+    "standalone": os.environ.get("CONSURF_GRADE_PARSER_STANDALONE", "vectorized"),
+}
+CONSURF_MSA_VARIATION_PARSER_ENGINE = os.environ.get("CONSURF_MSA_VARIATION_PARSER_ENGINE", "typed")
+CONSURF_PARSE_CACHE_SHARED = os.environ.get("CONSURF_PARSE_CACHE_SHARED", "True") == "True"
+CONSURF_PARSE_CACHE_TIMEOUT = int(os.environ.get("CONSURF_PARSE_CACHE_TIMEOUT", 60 * 60 * 24))
+CONSURF_PARSE_CACHE_LOCAL_SIZE = int(os.environ.get("CONSURF_PARSE_CACHE_LOCAL_SIZE", 32))
+CONSURF_BATCH_MAX_ACCESSIONS = int(os.environ.get("CONSURF_BATCH_MAX_ACCESSIONS", 500))
+CONSURF_BATCH_WORKERS = int(os.environ.get("CONSURF_BATCH_WORKERS", 8))
+CONSURF_RESIDUE_BATCH_SIZE = int(os.environ.get("CONSURF_RESIDUE_BATCH_SIZE", 2000))
+CONSURF_TYPEAHEAD_CHECK_INTERVAL = float(os.environ.get("CONSURF_TYPEAHEAD_CHECK_INTERVAL", 5))
+CONSURF_COUNT_CACHE_TIMEOUT = int(os.environ.get("CONSURF_COUNT_CACHE_TIMEOUT", 60 * 10))
+CONSURF_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get("CONSURF_COUNT_ESTIMATE_THRESHOLD", 100000))
+CONSURF_JOB_OUTPUT_FLUSH_INTERVAL = float(os.environ.get("CONSURF_JOB_OUTPUT_FLUSH_INTERVAL", 0.5))
+CONSURF_JOB_HEARTBEAT_INTERVAL = float(os.environ.get("CONSURF_JOB_HEARTBEAT_INTERVAL", 5))
+CONSURF_JOB_SAVE_INTERVAL = float(os.environ.get("CONSURF_JOB_SAVE_INTERVAL", 5))
+CONSURF_JOB_LOG_TAIL_SIZE = int(os.environ.get("CONSURF_JOB_LOG_TAIL_SIZE", 64 * 1024))
+CONSURF_JOB_LOG_SNAPSHOT_SIZE = int(os.environ.get("CONSURF_JOB_LOG_SNAPSHOT_SIZE", 1024 * 1024))
+CONSURF_JOB_EVENTS_REDIS_URL = os.environ.get("CONSURF_JOB_EVENTS_REDIS_URL", REDIS_URL)
+CONSURF_JOB_EVENTS_MAXLEN = int(os.environ.get("CONSURF_JOB_EVENTS_MAXLEN", 1000))
+CONSURF_JOB_EVENTS_TTL = int(os.environ.get("CONSURF_JOB_EVENTS_TTL", 60 * 60 * 24 * 7))
+CONSURF_WS_COALESCE_WINDOW = float(os.environ.get("CONSURF_WS_COALESCE_WINDOW", 0.25))
+CONSURF_WS_BROADCAST_RATE = float(os.environ.get("CONSURF_WS_BROADCAST_RATE", 1))
+CONSURF_WS_BROADCAST_BURST = int(os.environ.get("CONSURF_WS_BROADCAST_BURST", 5))
+CONSURF_WS_AUTH_CACHE_TIMEOUT = int(os.environ.get("CONSURF_WS_AUTH_CACHE_TIMEOUT", 60))
+CONSURF_JOB_RESULT_REUSE = os.environ.get("CONSURF_JOB_RESULT_REUSE", "True") == "True"
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
@@ -249,7 +276,7 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'ct.pagination.CachedCountLimitOffsetPagination',
     'PAGE_SIZE': 10
 }
 
@@ -7,7 +7,8 @@ from rest_framework_simplejwt.views import (
 )
 
 from ct.views import CONSURFModelViewSet, ProteinFastaDatabaseViewSet, ConsurfJobViewSet, DataChunkedUploadView, \
-    LogoutView, UserViewSet, MultipleSequenceAlignmentViewSet, StructureFileViewSet, set_csrf, GetUniProtProxy
+    LogoutView, UserViewSet, MultipleSequenceAlignmentViewSet, StructureFileViewSet, set_csrf, GetUniProtProxy, \
+    ConsurfResidueViewSet
 
 router = DefaultRouter()
 router.register(r'consurf', CONSURFModelViewSet)
@@ -16,6 +17,7 @@ router.register(r'job', ConsurfJobViewSet)
 router.register(r'users', UserViewSet)
 router.register(r'msa', MultipleSequenceAlignmentViewSet)
 router.register(r'structure', StructureFileViewSet)
+router.register(r'residue', ConsurfResidueViewSet)
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/token-auth/', obtain_auth_token),
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+
+
+def _version_key(model) -> str:
+    return f"consurf_count:version:{model._meta.label_lower}"
+
+
+def _version(model):
+    try:
+        return cache.get(_version_key(model), 0)
+    except Exception:
+        return None
+
+
+def _bump(models):
+    for model in models:
+        try:
+            cache.incr(_version_key(model))
+        except ValueError:
+            cache.set(_version_key(model), 1, timeout=None)
+        except Exception:
+            pass
+
+
+def invalidate(*models):
+    """
+    Make every cached count of these models stale once the current transaction commits, called from the post_save
+    and post_delete receivers. A count cached before the commit would otherwise be kept under the new version.
+    """
+    transaction.on_commit(lambda: _bump(models))
+
+
+def estimate(queryset) -> int | None:
+    """
+    The planner estimate of the number of rows of the table behind an unfiltered queryset, from the postgres
+    statistics, or None when it is not available.
+    """
+    query = queryset.query
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql" or query.where or query.distinct or query.is_sliced:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if not row or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def count(queryset) -> int:
+    """
+    Count the rows of a queryset. Unfiltered querysets on large postgres tables use the planner estimate once
+    it is above CONSURF_COUNT_ESTIMATE_THRESHOLD, other counts are cached until a row of the model changes.
+    """
+    threshold = settings.CONSURF_COUNT_ESTIMATE_THRESHOLD
+    if threshold:
+        estimated = estimate(queryset)
+        if estimated is not None and estimated >= threshold:
+            return estimated
+
+    version = _version(queryset.model)
+    if version is None:
+        return queryset.count()
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0
+    # str(query) does not quote its parameters, so different filters can print the same
+    query_hash = hashlib.md5(f"{sql}\n{params!r}".encode()).hexdigest()
+    key = f"consurf_count:{queryset.model._meta.label_lower}:{version}:{query_hash}"
+    try:
+        result = cache.get(key)
+    except Exception:
+        result = None
+    if result is None:
+        result = queryset.count()
+        try:
+            cache.set(key, result, timeout=settings.CONSURF_COUNT_CACHE_TIMEOUT)
+        except Exception:
+            pass
+    return result
@@ -0,0 +1,235 @@
+import hashlib
+import itertools
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+from ct import utils, sidecar
+
+# parsers whose results can be cached, keyed by the short name used in the cache keys
+READERS = {
+    "grade": utils.read_consurf_grade_file,
+    "grade_new": utils.read_consurf_grade_file_new,
+    "msa_variation": utils.read_consurf_msa_variation_file,
+}
+
+_lock = threading.Lock()
+_local = OrderedDict()
+_counters = {"local_hits": 0, "shared_hits": 0, "misses": 0, "sidecar_loads": 0, "invalidations": 0}
+
+
+def _count(name: str):
+    with _lock:
+        _counters[name] += 1
+
+
+def _file_key(kind: str, file_path: str, stat: os.stat_result, member_name: str = "") -> str:
+    path_hash = hashlib.md5(f"{os.path.abspath(file_path)}!{member_name}".encode()).hexdigest()
+    return f"consurf_parse:{kind}:{path_hash}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _local_get(key: str):
+    with _lock:
+        df = _local.get(key)
+        if df is not None:
+            _local.move_to_end(key)
+        return df
+
+
+def _local_set(key: str, df: pd.DataFrame):
+    size = settings.CONSURF_PARSE_CACHE_LOCAL_SIZE
+    if size <= 0:
+        return
+    with _lock:
+        _local[key] = df
+        _local.move_to_end(key)
+        while len(_local) > size:
+            _local.popitem(last=False)
+
+
+def _cached_lookup(key: str):
+    df = _local_get(key)
+    if df is not None:
+        _count("local_hits")
+        return df
+
+    if settings.CONSURF_PARSE_CACHE_SHARED:
+        try:
+            df = cache.get(key)
+        except Exception:
+            df = None
+        if df is not None:
+            _count("shared_hits")
+            _local_set(key, df)
+            return df
+    _count("misses")
+    return None
+
+
+def _cached_store(key: str, df: pd.DataFrame):
+    _local_set(key, df)
+    if settings.CONSURF_PARSE_CACHE_SHARED:
+        try:
+            cache.set(key, df, timeout=settings.CONSURF_PARSE_CACHE_TIMEOUT)
+        except Exception:
+            pass
+
+
+def read_cached(kind: str, file_path: str) -> pd.DataFrame:
+    """
+    Return the parsed dataframe of a consurf file. The in-process LRU and the shared django cache are tried
+    first, then the columnar sidecar of the file, and the text parser only runs when none of them is up to date.
+    The returned dataframe is shared between requests and must not be modified in place.
+    """
+    key = _file_key(kind, file_path, os.stat(file_path))
+    df = _cached_lookup(key)
+    if df is not None:
+        return df
+
+    df = sidecar.read_sidecar(kind, file_path)
+    if df is None:
+        df = READERS[kind](file_path)
+    else:
+        _count("sidecar_loads")
+    _cached_store(key, df)
+    return df
+
+
+def read_cached_member(kind: str, zip_path: str, member_name: str) -> pd.DataFrame:
+    """Same as read_cached for a member of a zip archive, which is decompressed in memory on a miss."""
+    key = _file_key(kind, zip_path, os.stat(zip_path), member_name)
+    df = _cached_lookup(key)
+    if df is not None:
+        return df
+
+    with utils.open_zip_member(zip_path, member_name) as member:
+        df = READERS[kind](member)
+    _cached_store(key, df)
+    return df
+
+
+def read_cached_many(kind: str, items, workers: int | None = None):
+    """
+    Load many files concurrently with read_cached. items is an iterable of (key, file_path) pairs and
+    (key, dataframe, error) is yielded for each of them in the same order, with error set instead of the
+    dataframe when the file could not be read. At most twice as many reads as workers are in flight, so a slow
+    consumer does not make the whole batch wait in memory. Pending reads are cancelled when the consumer stops early.
+    """
+    items = iter(items)
+    workers = workers or settings.CONSURF_BATCH_WORKERS
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for key, file_path in itertools.islice(items, workers * 2):
+            pending.append((key, executor.submit(read_cached, kind, file_path)))
+        while pending:
+            key, future = pending.popleft()
+            try:
+                result = (key, future.result(), None)
+            except Exception as e:
+                # a file that fails to parse in any way is reported on its own, not raised into the consumer
+                result = (key, None, e)
+            for next_key, file_path in itertools.islice(items, 1):
+                pending.append((next_key, executor.submit(read_cached, kind, file_path)))
+            yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# the loose file a job leaves in its folder and how to find the same file in Consurf_Outputs.zip
+JOB_FILES = {
+    "grade_new": ("no_model_consurf_grades.txt", utils.find_consurf_grade_member),
+    "msa_variation": ("msa_aa_variety_percentage.csv", utils.find_consurf_msa_variation_member),
+}
+
+
+def read_cached_job_file(kind: str, job_path: str) -> pd.DataFrame:
+    """
+    Read a result file of a job folder, from the loose copy when there is one and otherwise from the job archive.
+    Raises FileNotFoundError when neither has it.
+    """
+    file_name, find_member = JOB_FILES[kind]
+    path = os.path.join(job_path, file_name)
+    if os.path.exists(path):
+        return read_cached(kind, path)
+    zip_path = os.path.join(job_path, "Consurf_Outputs.zip")
+    return read_cached_member(kind, zip_path, find_member(zip_path))
+
+
+def build_sidecar(kind: str, file_path: str) -> str:
+    return sidecar.write_sidecar(kind, file_path, READERS[kind](file_path))
+
+
+def build_job_sidecars(job_path: str) -> list[str]:
+    """Write the sidecars of the grade and MSA variation files found in a job output folder."""
+    built = []
+    for name in os.listdir(job_path):
+        if name.endswith("_consurf_grades.txt"):
+            kind = "grade_new"
+        elif name == "msa_aa_variety_percentage.csv":
+            kind = "msa_variation"
+        else:
+            continue
+        try:
+            built.append(build_sidecar(kind, os.path.join(job_path, name)))
+        except (ValueError, OSError):
+            continue
+    return built
+
+
+def invalidate(file_path: str):
+    """
+    Drop every cached parse of file_path, and of its members when it is a zip archive. Files that no longer exist
+    cannot be looked up again and are skipped.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return
+    members = [""]
+    if zipfile.is_zipfile(file_path):
+        try:
+            members += list(utils.zip_directory(file_path))
+        except (OSError, zipfile.BadZipFile):
+            pass
+    keys = [_file_key(kind, file_path, stat, member) for kind in READERS for member in members]
+    with _lock:
+        for key in keys:
+            _local.pop(key, None)
+        _counters["invalidations"] += 1
+    if settings.CONSURF_PARSE_CACHE_SHARED:
+        try:
+            cache.delete_many(keys)
+        except Exception:
+            pass
+
+
+def invalidate_directory(directory: str):
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            invalidate(path)
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_counters)
+        result["local_entries"] = len(_local)
+    lookups = result["local_hits"] + result["shared_hits"] + result["misses"]
+    result["hit_ratio"] = (result["local_hits"] + result["shared_hits"]) / lookups if lookups else 0.0
+    return result
+
+
+def clear_local():
+    with _lock:
+        _local.clear()
+        for name in _counters:
+            _counters[name] = 0
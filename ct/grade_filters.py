@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+BE_VALUES = ("b", "e")
+FUNCTION_VALUES = ("f", "s")
+
+
+@dataclass(frozen=True)
+class GradeFilter:
+    pos_from: int | None = None
+    pos_to: int | None = None
+    colors: frozenset[int] | None = None
+    be: frozenset[str] | None = None
+    function: frozenset[str] | None = None
+
+    def is_empty(self) -> bool:
+        return self == GradeFilter()
+
+
+def _int_param(params, name: str) -> int | None:
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def _choice_param(params, name: str, choices) -> frozenset | None:
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    values = frozenset(v.strip() for v in value.split(",") if v.strip())
+    if not values or not values <= set(choices):
+        raise ValueError(f"{name} must be a comma separated list of {', '.join(map(str, choices))}")
+    return values
+
+
+def parse_grade_filter(params) -> GradeFilter:
+    """
+    Read the residue window and filters from query parameters: pos_from and pos_to (inclusive), color as a comma
+    separated list of grades from 1 to 9, be as b and/or e and function as f and/or s. Raises ValueError on
+    invalid values.
+    """
+    pos_from, pos_to = _int_param(params, "pos_from"), _int_param(params, "pos_to")
+    if pos_from is not None and pos_to is not None and pos_from > pos_to:
+        raise ValueError("pos_from must not be greater than pos_to")
+    colors = _choice_param(params, "color", [str(grade) for grade in range(1, 10)])
+    return GradeFilter(
+        pos_from=pos_from,
+        pos_to=pos_to,
+        colors=frozenset(map(int, colors)) if colors else None,
+        be=_choice_param(params, "be", BE_VALUES),
+        function=_choice_param(params, "function", FUNCTION_VALUES),
+    )
+
+
+def _position_window(positions: pd.Series, pos_from: int | None, pos_to: int | None) -> slice | np.ndarray:
+    # grade files list residues in order, so the window is two binary searches and a zero copy slice
+    values = positions.to_numpy()
+    if positions.is_monotonic_increasing:
+        start = 0 if pos_from is None else int(np.searchsorted(values, pos_from, side="left"))
+        stop = len(values) if pos_to is None else int(np.searchsorted(values, pos_to, side="right"))
+        return slice(start, stop)
+    mask = np.ones(len(values), dtype=bool)
+    if pos_from is not None:
+        mask &= values >= pos_from
+    if pos_to is not None:
+        mask &= values <= pos_to
+    return mask
+
+
+def grade_numbers(colors: pd.Series) -> np.ndarray:
+    """
+    The conservation grade of each residue as a number. Webserver files give it as a string with a trailing * for
+    low confidence residues and standalone files as a one item list, in both cases it is a single digit first.
+    """
+    return pd.to_numeric(colors.str[0], errors="coerce").to_numpy()
+
+
+def apply_grade_filter(df: pd.DataFrame, grade_filter: GradeFilter) -> pd.DataFrame:
+    """Select the residues of a parsed grade dataframe that match grade_filter, without modifying df."""
+    if grade_filter.is_empty():
+        return df
+    if grade_filter.pos_from is not None or grade_filter.pos_to is not None:
+        df = df[_position_window(df["POS"], grade_filter.pos_from, grade_filter.pos_to)]
+
+    mask = np.ones(len(df), dtype=bool)
+    if grade_filter.colors:
+        mask &= np.isin(grade_numbers(df["COLOR"]), list(grade_filter.colors))
+    if grade_filter.be:
+        mask &= df["BE"].isin(grade_filter.be).to_numpy()
+    if grade_filter.function:
+        mask &= df["FUNCTION"].isin(grade_filter.function).to_numpy()
+    if not mask.all():
+        df = df[mask]
+    return df
@@ -0,0 +1,229 @@
+import json
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+
+COUNTERS = ("sent", "merged", "broadcasts", "dropped_broadcasts")
+# counts are added up in the process and pushed to the shared cache at most this often, not once per message
+COUNT_PUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_pending_counts = dict.fromkeys(COUNTERS, 0)
+_pushed_at = 0.0
+
+
+def _counter_key(name: str) -> str:
+    return f"consurf_ws_stats:{name}"
+
+
+def _push_counts():
+    global _pushed_at
+    with _lock:
+        pending = {name: n for name, n in _pending_counts.items() if n}
+        for name in pending:
+            _pending_counts[name] = 0
+        _pushed_at = time.monotonic()
+    for name, n in pending.items():
+        key = _counter_key(name)
+        try:
+            try:
+                cache.incr(key, n)
+            except ValueError:
+                if not cache.add(key, n, timeout=None):
+                    cache.incr(key, n)
+        except Exception:
+            pass
+
+
+def count(name: str, n: int = 1):
+    """Add n to one of the websocket message COUNTERS, which are shared by every process through the cache."""
+    if not n:
+        return
+    with _lock:
+        _pending_counts[name] += n
+        due = time.monotonic() - _pushed_at >= COUNT_PUSH_INTERVAL
+    if due:
+        _push_counts()
+
+
+def stats() -> dict:
+    """Websocket message counters of all processes, up to COUNT_PUSH_INTERVAL seconds behind for the others."""
+    _push_counts()
+    try:
+        values = cache.get_many([_counter_key(name) for name in COUNTERS])
+    except Exception:
+        values = {}
+    return {name: values.get(_counter_key(name), 0) for name in COUNTERS}
+
+
+def stream_key(job_id: int) -> str:
+    return f"consurf_job:events:{job_id}"
+
+
+@lru_cache(maxsize=4)
+def _client(url: str) -> redis.Redis:
+    return redis.Redis.from_url(url, socket_timeout=5)
+
+
+def _connection() -> redis.Redis | None:
+    """The redis client of the job event streams, or None when they are turned off."""
+    url = settings.CONSURF_JOB_EVENTS_REDIS_URL
+    return _client(url) if url else None
+
+
+def event_key(event_id: str) -> tuple[int, int]:
+    """Stream ids are <milliseconds>-<sequence>, compared as a pair of numbers."""
+    milliseconds, _, sequence = str(event_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def publish(job_id: int, message: dict) -> str | None:
+    """
+    Append a job event to the stream of the job, capped at about CONSURF_JOB_EVENTS_MAXLEN entries and expired
+    CONSURF_JOB_EVENTS_TTL seconds after the last event. Returns the id of the event, or None when it could not be
+    stored, in which case clients only get it live.
+    """
+    client = _connection()
+    if client is None:
+        return None
+    key = stream_key(job_id)
+    try:
+        pipeline = client.pipeline(transaction=False)
+        pipeline.xadd(key, {"message": json.dumps(message)}, maxlen=settings.CONSURF_JOB_EVENTS_MAXLEN,
+                      approximate=True)
+        pipeline.expire(key, settings.CONSURF_JOB_EVENTS_TTL)
+        event_id, _ = pipeline.execute()
+    except redis.RedisError:
+        return None
+    return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+
+def send(channel, session_id: str, message: dict, store: bool = True) -> None:
+    """
+    Send a job message to the websocket group of the session. Messages with a job_id are also stored in the event
+    stream of the job unless store is False, and carry their event_id so a client knows where to resume from.
+    """
+    if store and message.get("job_id") is not None:
+        event_id = publish(message["job_id"], message)
+        if event_id:
+            message = {**message, "event_id": event_id}
+    async_to_sync(channel.group_send)(f'job_{session_id}', {'type': 'job_message', 'message': message})
+
+
+def replay(job_id: int, last_event_id: str | None = None) -> tuple[list[dict], bool]:
+    """
+    The stored events of a job after last_event_id, or all of them when it is None, and whether some events may be
+    missing because the stream was trimmed or has expired since last_event_id, or, without last_event_id, because
+    the log deltas that are left do not start at the beginning of the logs. Raises ValueError when last_event_id is
+    not a stream id.
+    """
+    client = _connection()
+    if client is None:
+        return [], last_event_id is not None
+    start = "-" if last_event_id is None else "%d-%d" % event_key(last_event_id)
+    try:
+        entries = client.xrange(stream_key(job_id), min=start, max="+")
+    except redis.RedisError:
+        return [], True
+
+    events = []
+    found = last_event_id is None
+    # replaying from the start, the log deltas have to cover each log from its first byte, deltas trimmed off the
+    # front of the stream show up as a first offset above 0
+    positions = {}
+    for event_id, fields in entries:
+        event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+        if last_event_id is not None and event_key(event_id) == event_key(last_event_id):
+            found = True
+            continue
+        event = json.loads(fields[b"message"] if b"message" in fields else fields["message"])
+        if last_event_id is None and event.get("type") == "log_delta":
+            for name, stream in event.get("streams", {}).items():
+                if stream.get("offset") != positions.get(name, 0):
+                    found = False
+                positions[name] = stream.get("end")
+        events.append({**event, "event_id": event_id})
+    return events, not found
+
+
+def _job_id(message):
+    return message.get("job_id") if isinstance(message, dict) else None
+
+
+def _is_status(message: dict) -> bool:
+    return "type" not in message and "status" in message
+
+
+class MessageCoalescer:
+    """
+    Hold the job messages bound for one websocket until they are flushed, merging consecutive log_delta messages
+    of a job into one and keeping only the latest status message of each job. Other messages are kept as they are.
+    """
+    def __init__(self):
+        self.pending = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, message):
+        job_id = message.get("job_id") if isinstance(message, dict) else None
+        if job_id is not None and _is_status(message):
+            kept = [m for m in self.pending if not (_job_id(m) == job_id and _is_status(m))]
+            count("merged", len(self.pending) - len(kept))
+            kept.append(message)
+            self.pending = kept
+            return
+        if job_id is not None and message.get("type") == "log_delta":
+            # status messages are always moved to the end, so they do not keep deltas apart
+            index = next((i for i in range(len(self.pending) - 1, -1, -1)
+                          if _job_id(self.pending[i]) == job_id and not _is_status(self.pending[i])), None)
+            if index is not None and self.pending[index].get("type") == "log_delta" and \
+                    self._merge(self.pending[index], message):
+                # the merged delta now has the newest event id of the job, so it goes after any status it passed
+                self.pending.append(self.pending.pop(index))
+                count("merged")
+                return
+        # merging updates the held message, so hold a copy
+        self.pending.append(dict(message) if isinstance(message, dict) else message)
+
+    @staticmethod
+    def _merge(previous: dict, message: dict) -> bool:
+        streams = previous["streams"]
+        if any(streams[name]["end"] != stream["offset"] for name, stream in message["streams"].items()):
+            return False
+        previous["streams"] = {
+            name: {**streams[name], "end": stream["end"], "data": streams[name]["data"] + stream["data"]}
+            for name, stream in message["streams"].items()
+        }
+        previous["status"] = message["status"]
+        if "event_id" in message:
+            previous["event_id"] = message["event_id"]
+        return True
+
+    def drain(self) -> list:
+        pending, self.pending = self.pending, []
+        count("sent", len(pending))
+        return pending
+
+
+class RateLimiter:
+    """A token bucket allowing rate events per second on average and up to burst at once."""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
@@ -0,0 +1,201 @@
+import io
+import os
+from collections import deque
+
+from django.conf import settings
+
+from ct.models import ConsurfJob
+
+# a job has two log streams, stdout is stored in log_data and stderr in error_data
+STREAM_FIELDS = {"stdout": "log_data", "stderr": "error_data"}
+LOG_FILES = {"stdout": "stdout.log", "stderr": "stderr.log"}
+
+
+def job_log_path(job_id: int, stream: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job_id), LOG_FILES[stream])
+
+
+class LogTail:
+    """A ring buffer that keeps the last limit characters appended to it."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+
+    def append(self, text: str):
+        self.chunks.append(text)
+        self.size += len(text)
+        while self.size - len(self.chunks[0]) >= self.limit:
+            self.size -= len(self.chunks.popleft())
+
+    def text(self) -> str:
+        text = "".join(self.chunks)[-self.limit:]
+        self.chunks = deque([text]) if text else deque()
+        self.size = len(text)
+        return text
+
+
+class JobLogSink:
+    """
+    Append the output of a running job to stdout.log and stderr.log in its directory, and keep the tail of each
+    stream in memory for the job row. Offsets are byte positions in the log files.
+    """
+    def __init__(self, job_path: str, tail_size: int):
+        self.files = {stream: open(os.path.join(job_path, name), "wb", buffering=0)
+                      for stream, name in LOG_FILES.items()}
+        self.offsets = {stream: 0 for stream in LOG_FILES}
+        self.tails = {stream: LogTail(tail_size) for stream in LOG_FILES}
+
+    def append(self, data: dict) -> dict:
+        """Write the text given for each stream and return where it starts and ends in its log file."""
+        streams = {}
+        for stream, f in self.files.items():
+            text = data.get(stream, "")
+            start = self.offsets[stream]
+            if text:
+                self.offsets[stream] += f.write(text.encode())
+                self.tails[stream].append(text)
+            streams[stream] = {"offset": start, "end": self.offsets[stream], "data": text}
+        return streams
+
+    def tail(self, stream: str) -> str:
+        return self.tails[stream].text()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_log(consurf_job: ConsurfJob, stream: str):
+    """
+    Open the log of a stream as a binary file. Jobs that ran before logs were written to disk have the whole log in
+    the row instead.
+    """
+    try:
+        return open(job_log_path(consurf_job.id, stream), "rb")
+    except FileNotFoundError:
+        return io.BytesIO((getattr(consurf_job, STREAM_FIELDS[stream]) or "").encode())
+
+
+def log_size(f) -> int:
+    return f.seek(0, os.SEEK_END)
+
+
+def log_sizes(consurf_job: ConsurfJob) -> dict:
+    sizes = {}
+    for stream in STREAM_FIELDS:
+        with open_log(consurf_job, stream) as f:
+            sizes[stream] = log_size(f)
+    return sizes
+
+
+def tail_lines(f, size: int, lines: int, block_size: int = 65536) -> bytes:
+    """The last lines of a binary file of size bytes, read backwards a block at a time."""
+    # a newline at the very end closes the last line instead of starting an empty one
+    end = size
+    if size:
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            end -= 1
+    position, blocks, newlines = end, [], 0
+    while position > 0 and newlines < lines:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        block = f.read(step)
+        blocks.append(block)
+        newlines += block.count(b"\n")
+    data = b"".join(reversed(blocks))
+    if newlines >= lines:
+        data = data.rsplit(b"\n", lines)[-lines:]
+        data = b"\n".join(data)
+    return data + b"\n" * (size - end)
+
+
+def delta_message(consurf_job: ConsurfJob, session_id: str, streams: dict) -> dict:
+    """
+    A log_delta message with only the text each stream received since the previous message, and the byte offsets
+    in the log file at which it starts and ends. A client whose log is shorter than an offset knows it missed a
+    message and can ask for a resync.
+    """
+    return {
+        "type": "log_delta",
+        "job_id": consurf_job.id,
+        "status": consurf_job.status,
+        "session_id": session_id,
+        "streams": streams,
+    }
+
+
+def _char_start(f, offset: int) -> int:
+    """Move offset back to the first byte of the utf-8 character it falls in."""
+    start = max(0, offset - 3)
+    f.seek(start)
+    head = f.read(offset - start + 1)
+    while offset > start and offset - start < len(head) and 0x80 <= head[offset - start] < 0xC0:
+        offset -= 1
+    return offset
+
+
+def _cut_char(data: bytes) -> tuple[int, int]:
+    """The bytes of a utf-8 character cut off at the end of data that are held and that are missing."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            break
+        if byte >= 0xC0:
+            length = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if back < length:
+                return back, length - back
+            break
+    return 0, 0
+
+
+def snapshot_message(consurf_job: ConsurfJob, offsets: dict, limit: int) -> dict:
+    """
+    A log_snapshot message with up to limit bytes of each stream from the requested offset. Both ends are moved
+    to utf-8 character boundaries, so offset can be before the one asked for and end is where the next request
+    starts. size is the length of the log, a client keeps asking from end until it reaches it.
+    """
+    streams = {}
+    for stream in STREAM_FIELDS:
+        with open_log(consurf_job, stream) as f:
+            size = log_size(f)
+            try:
+                offset = min(max(int(offsets.get(stream) or 0), 0), size)
+            except (TypeError, ValueError):
+                offset = 0
+            offset = _char_start(f, offset)
+            f.seek(offset)
+            data = f.read(limit)
+            held, missing = _cut_char(data)
+            if held:
+                # a limit below the size of one character still has to move forward
+                data = data[:-held] if held < len(data) else data + f.read(missing)
+        streams[stream] = {"offset": offset, "end": offset + len(data), "size": size,
+                           "data": data.decode(errors="replace")}
+    return {
+        "type": "log_snapshot",
+        "job_id": consurf_job.id,
+        "status": consurf_job.status,
+        "session_id": consurf_job.session_id,
+        "streams": streams,
+    }
+
+
+def job_for_resync(job_id, user, session_id: str) -> ConsurfJob | None:
+    """The job a websocket client asked to resync, if it belongs to the user or to the websocket session."""
+    try:
+        consurf_job = ConsurfJob.objects.only("id", "status", "session_id", "user_id", *STREAM_FIELDS.values()).get(
+            id=int(job_id))
+    except (ConsurfJob.DoesNotExist, TypeError, ValueError):
+        return None
+    if consurf_job.session_id == session_id or (user.is_authenticated and consurf_job.user_id == user.id):
+        return consurf_job
+    return None
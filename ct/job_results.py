@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import shutil
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ct.models import ConsurfJob
+
+# bump when the command line built from a job changes in a way that changes its outputs
+RESULT_KEY_VERSION = 1
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# job fields that are passed to stand_alone_consurf.py
+PARAMETER_FIELDS = (
+    "alignment_program", "algorithm", "substitution_model", "max_homologs", "max_iterations", "max_id", "min_id",
+    "cutoff", "closest", "maximum_likelihood", "is_nucleotide", "chain", "query_name",
+)
+
+
+def file_checksum(path: str) -> str:
+    """The sha256 of a file, cached for as long as its size and modification time stay the same."""
+    stat = os.stat(path)
+    path_hash = hashlib.md5(os.path.abspath(path).encode()).hexdigest()
+    key = f"consurf_checksum:{path_hash}:{stat.st_size}:{stat.st_mtime_ns}"
+    checksum = cache.get(key)
+    if checksum is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(CHECKSUM_CHUNK_SIZE):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        cache.set(key, checksum, None)
+    return checksum
+
+
+def _normalize_sequence(sequence: str | None) -> str:
+    return "\n".join(line.strip() for line in (sequence or "").strip().splitlines())
+
+
+def result_key(consurf_job: ConsurfJob) -> str:
+    """
+    A hash of everything that decides the outputs of a job: the query sequence, the checksums of its database,
+    MSA and structure files and its parameters. Raises OSError when one of the files cannot be read.
+    """
+    content = {
+        "version": RESULT_KEY_VERSION,
+        "query_sequence": _normalize_sequence(consurf_job.query_sequence),
+        "fasta_database": file_checksum(consurf_job.fasta_database.fasta_file.path)
+        if consurf_job.fasta_database else None,
+        "msa": file_checksum(consurf_job.msa.msa_file.path) if consurf_job.msa else None,
+        "structure": file_checksum(consurf_job.structure_file.structure_file.path)
+        if consurf_job.structure_file and consurf_job.chain else None,
+        **{field: getattr(consurf_job, field) for field in PARAMETER_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def job_path(job_id: int) -> str:
+    return os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job_id))
+
+
+def find_reusable(key: str, user_id: int | None) -> ConsurfJob | None:
+    """
+    The latest completed job of the user with the same result key whose outputs are still on disk. Jobs of other
+    users are never reused, their outputs and command line are not the user's to see.
+    """
+    if user_id is None:
+        return None
+    candidates = ConsurfJob.objects.filter(result_key=key, status="completed", user_id=user_id).only(
+        "id", "log_data", "error_data", "process_cmd")[:5]
+    for candidate in candidates:
+        if os.path.exists(os.path.join(job_path(candidate.id), "Consurf_Outputs.zip")):
+            return candidate
+    return None
+
+
+def _link_or_copy(source: str, destination: str):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def reuse_outputs(source: ConsurfJob, consurf_job: ConsurfJob):
+    """
+    Complete consurf_job with the outputs of source. Files are hardlinked into the new job directory, or copied
+    when the filesystem does not allow it, so sidecars stay valid and nothing is parsed again.
+    """
+    destination = job_path(consurf_job.id)
+    try:
+        shutil.copytree(job_path(source.id), destination, copy_function=_link_or_copy)
+    except OSError:
+        # a job run in a half linked directory would write through the links into the outputs of source
+        shutil.rmtree(destination, ignore_errors=True)
+        raise
+    consurf_job.status = "completed"
+    consurf_job.log_data = source.log_data
+    consurf_job.error_data = source.error_data
+    consurf_job.process_cmd = source.process_cmd
+    consurf_job.save()
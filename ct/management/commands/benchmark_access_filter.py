@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from ct.models import ProteinFastaDatabase
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    A command that seeds FASTA database rows inside a transaction that is rolled back afterwards, and times the
+    OR over the shared_with join with distinct, a correlated EXISTS on the through table and the accessible_to filter
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--resources', type=int, default=100000, help='Number of resources to seed')
+        parser.add_argument('--users', type=int, default=200, help='Number of users to seed')
+        parser.add_argument('--public', type=float, default=0.05, help='Fraction of public resources')
+        parser.add_argument('--shared', type=float, default=0.2, help='Fraction of resources shared with others')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per query')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.seed(options)
+                self.compare(user, options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            [User(username=f"benchmark_access_{i}") for i in range(options['users'])])
+        resources = ProteinFastaDatabase.objects.bulk_create(
+            [ProteinFastaDatabase(name=f"db{i}", fasta_file="benchmark.fasta", user=rng.choice(users),
+                                  is_public=rng.random() < options['public'])
+             for i in range(options['resources'])],
+            batch_size=5000,
+        )
+        through = ProteinFastaDatabase.shared_with.through
+        shares = {
+            (resource.id, rng.choice(users).id)
+            for resource in resources if rng.random() < options['shared']
+        }
+        through.objects.bulk_create(
+            [through(proteinfastadatabase_id=resource_id, user_id=user_id) for resource_id, user_id in shares],
+            batch_size=5000,
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {ProteinFastaDatabase._meta.db_table}")
+                cursor.execute(f"ANALYZE {through._meta.db_table}")
+        self.stdout.write(f"Seeded {len(resources)} resources, {len(shares)} shares and {len(users)} users")
+        return users[0]
+
+    def compare(self, user, repeat):
+        queries = {
+            "or_distinct": lambda: ProteinFastaDatabase.objects.filter(
+                Q(user_id=user.id) | Q(is_public=True) | Q(shared_with__id=user.id)).distinct().order_by("id"),
+            "exists": lambda: ProteinFastaDatabase.objects.filter(
+                Q(user_id=user.id) | Q(is_public=True) | Exists(ProteinFastaDatabase.shared_with.through.objects.filter(
+                    proteinfastadatabase_id=OuterRef("pk"), user_id=user.id))).order_by("id"),
+            "accessible_to": lambda: ProteinFastaDatabase.objects.accessible_to(user).order_by("id"),
+        }
+        results = {}
+        for name, make in queries.items():
+            for label, run in (("count", lambda: make().count()),
+                               ("first page", lambda: list(make().values_list("id", flat=True)[:100])),
+                               ("deep page", lambda: list(make().values_list("id", flat=True)[5000:5100]))):
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    value = run()
+                    timings.append(time.perf_counter() - start)
+                results[(name, label)] = value
+                self.stdout.write(f"{name} {label}: best {min(timings) * 1000:.2f} ms, "
+                                  f"mean {sum(timings) / len(timings) * 1000:.2f} ms")
+        for name, label in results:
+            if results[(name, label)] != results[("or_distinct", label)]:
+                self.stderr.write(f"{name} disagrees with or_distinct on the {label}")
+                return
+        self.stdout.write(self.style.SUCCESS("All filters returned the same rows"))
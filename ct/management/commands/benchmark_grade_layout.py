@@ -0,0 +1,52 @@
+import json
+import os
+import time
+
+import pandas as pd
+from django.core.management import BaseCommand, CommandError
+
+from ct import responses, utils
+
+
+class Command(BaseCommand):
+    """
+    A command that serializes a consurf grades file in the records and columns layouts of the grade endpoints and
+    times how long a client takes to parse each body, and checks that both hold the same rows
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str, help='Path to a consurf grades file')
+        parser.add_argument('--format', type=str, choices=['webserver', 'standalone'], default='standalone',
+                            help='Layout of the grades file')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed parses per layout')
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Repeat the residue rows this many times to simulate a longer protein')
+
+    def handle(self, *args, **options):
+        reader = utils.read_consurf_grade_file_new if options['format'] == 'standalone' else utils.read_consurf_grade_file
+        file_path = options['file_path']
+        if not os.path.isfile(file_path):
+            raise CommandError(f"File not found: {file_path}")
+        df = reader(file_path)
+        if options['scale'] > 1:
+            df = pd.concat([df] * options['scale'], ignore_index=True)
+
+        bodies = {
+            "records": b"".join(responses.iter_json_array(df)),
+            "columns": b"".join(responses.iter_json_columns(df)),
+        }
+        parsed = {}
+        for layout, body in bodies.items():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                parsed[layout] = json.loads(body)
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f"{layout}: {len(df)} residues, {len(body) / 1024:.1f} KiB, "
+                              f"parse best {min(timings) * 1000:.2f} ms, "
+                              f"mean {sum(timings) / len(timings) * 1000:.2f} ms")
+
+        columns = parsed["columns"]
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        if rows != parsed["records"]:
+            raise CommandError("The columns layout does not hold the same rows as the records layout")
+        self.stdout.write(self.style.SUCCESS("Both layouts hold the same rows"))
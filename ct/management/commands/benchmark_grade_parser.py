@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+from django.core.management import BaseCommand, CommandError
+
+from ct import utils
+
+
+class Command(BaseCommand):
+    """
+    A command that times the legacy and vectorized consurf grade parsers on the same file and checks that
+    both return the same dataframe
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str, help='Path to a consurf grades file')
+        parser.add_argument('--format', type=str, choices=['webserver', 'standalone'], default='standalone',
+                            help='Layout of the grades file')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per engine')
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Repeat the residue rows this many times to simulate a longer protein')
+
+    def handle(self, *args, **options):
+        reader = utils.read_consurf_grade_file_new if options['format'] == 'standalone' else utils.read_consurf_grade_file
+        file_path = options['file_path']
+        if not os.path.isfile(file_path):
+            raise CommandError(f"File not found: {file_path}")
+
+        scaled_path = None
+        if options['scale'] > 1:
+            scaled_path = self.scale_file(file_path, reader, options['scale'])
+            file_path = scaled_path
+        try:
+            results = {}
+            for engine in utils.GRADE_PARSER_ENGINES:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    results[engine] = reader(file_path, engine=engine)
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                self.stdout.write(f"{engine}: {len(results[engine])} residues, best {best * 1000:.2f} ms, "
+                                  f"mean {sum(timings) / len(timings) * 1000:.2f} ms")
+            pd.testing.assert_frame_equal(results["legacy"], results["vectorized"])
+            self.stdout.write(self.style.SUCCESS("Both engines returned identical dataframes"))
+        finally:
+            if scaled_path:
+                os.remove(scaled_path)
+
+    def scale_file(self, file_path, reader, scale):
+        # keep the header as is and repeat every residue row, the parsers do not require unique positions
+        with open(file_path, "rt") as f:
+            lines = f.readlines()
+        header_end = None
+        for i, line in enumerate(lines):
+            if "SCORE" in line and "COLOR" in line and "CONFIDENCE INTERVAL" in line:
+                header_end = i + 1
+                break
+        if header_end is None:
+            raise CommandError("No header line found in file")
+        body = [line for line in lines[header_end:] if line.strip() and not line.startswith(("*", "or"))]
+        with tempfile.NamedTemporaryFile("wt", suffix=".txt", delete=False) as f:
+            f.writelines(lines[:header_end])
+            f.writelines(body * scale)
+        return f.name
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management import BaseCommand, CommandError
+
+from ct import utils
+
+
+class Command(BaseCommand):
+    """
+    A command that times the msa_aa_variety_percentage.csv parsers on the same file, reports the peak memory of a
+    parse and the size of the resulting dataframe, and checks that every engine returns the same values
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str, help='Path to a msa_aa_variety_percentage.csv file')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per engine')
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Repeat the residue rows this many times to simulate a longer protein')
+
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        if not os.path.isfile(file_path):
+            raise CommandError(f"File not found: {file_path}")
+
+        scaled_path = None
+        if options['scale'] > 1:
+            scaled_path = self.scale_file(file_path, options['scale'])
+            file_path = scaled_path
+        try:
+            results = {}
+            for engine in utils.MSA_VARIATION_PARSER_ENGINES:
+                if utils._msa_variation_parser_engine(engine) != engine:
+                    self.stdout.write(f"{engine}: not available")
+                    continue
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    utils.read_consurf_msa_variation_file(file_path, engine=engine)
+                    timings.append(time.perf_counter() - start)
+                tracemalloc.start()
+                results[engine] = utils.read_consurf_msa_variation_file(file_path, engine=engine)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                size = results[engine].memory_usage(deep=True).sum()
+                self.stdout.write(f"{engine}: {len(results[engine])} residues, best {min(timings) * 1000:.2f} ms, "
+                                  f"mean {sum(timings) / len(timings) * 1000:.2f} ms, "
+                                  f"peak {peak / 1024:.0f} KiB, dataframe {size / 1024:.0f} KiB")
+            self.compare(results)
+        finally:
+            if scaled_path:
+                os.remove(scaled_path)
+
+    def compare(self, results):
+        reference = results.pop("legacy")
+        for engine, df in results.items():
+            if list(df.columns) != list(reference.columns):
+                raise CommandError(f"{engine} returned different columns")
+            for column in reference.columns:
+                expected, actual = reference[column], df[column]
+                if expected.dtype.kind == "f":
+                    same = np.allclose(expected.to_numpy(), actual.to_numpy(dtype=np.float64), atol=1e-4,
+                                       equal_nan=True)
+                else:
+                    same = expected.astype(str).equals(actual.astype(str))
+                if not same:
+                    raise CommandError(f"{engine} returned different values in column {column}")
+        self.stdout.write(self.style.SUCCESS("All engines returned the same values"))
+
+    def scale_file(self, file_path, scale):
+        with open(file_path, "rt") as f:
+            lines = f.readlines()
+        header, body = lines[:5], [line for line in lines[5:] if line.strip()]
+        with tempfile.NamedTemporaryFile("wt", suffix=".csv", delete=False) as f:
+            f.writelines(header)
+            f.writelines(body * scale)
+        return f.name
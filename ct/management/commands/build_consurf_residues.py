@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+
+from ct.models import CONSURFModel, ConsurfJob, ConsurfResidue
+
+
+class Command(BaseCommand):
+    """
+    A command that fills the ConsurfResidue table from the grade files of existing CONSURFModel rows, and
+    optionally of completed jobs, skipping the ones that already have residues
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild residues that are already indexed')
+        parser.add_argument('--jobs', action='store_true', help='Also index completed jobs')
+
+    def handle(self, *args, **options):
+        indexed = residues = failed = 0
+        queryset = CONSURFModel.objects.exclude(consurf_grade="").exclude(consurf_grade__isnull=True).only(
+            "id", "uniprot_accession", "consurf_grade")
+        if not options['force']:
+            queryset = queryset.filter(residues__isnull=True)
+        for consurf in queryset.iterator(chunk_size=500):
+            try:
+                residues += ConsurfResidue.objects.index_consurf(consurf)
+                indexed += 1
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"{consurf.uniprot_accession}: {e}")
+
+        if options['jobs']:
+            jobs = ConsurfJob.objects.filter(status='completed').only("id", "uniprot_accession")
+            if not options['force']:
+                jobs = jobs.filter(residues__isnull=True)
+            for job in jobs.iterator(chunk_size=500):
+                try:
+                    residues += ConsurfResidue.objects.index_job(job)
+                    indexed += 1
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f"job {job.id}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {residues} residues of {indexed} entries, {failed} failed"))
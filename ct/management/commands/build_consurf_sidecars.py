@@ -0,0 +1,46 @@
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from ct import grade_cache, sidecar
+from ct.models import CONSURFModel, ConsurfJob
+
+
+class Command(BaseCommand):
+    """
+    A command that writes the columnar sidecars of existing CONSURFModel grade and MSA variation files, and
+    optionally of completed jobs, skipping the ones that are already up to date
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild sidecars that are already up to date')
+        parser.add_argument('--jobs', action='store_true', help='Also build sidecars for completed jobs')
+
+    def handle(self, *args, **options):
+        built = skipped = failed = 0
+        queryset = CONSURFModel.objects.only("id", "uniprot_accession", "consurf_grade", "consurf_msa_variation")
+        for consurf in queryset.iterator(chunk_size=500):
+            for kind, field in (("grade", consurf.consurf_grade), ("msa_variation", consurf.consurf_msa_variation)):
+                if not field:
+                    continue
+                path = field.path
+                if not os.path.exists(path):
+                    failed += 1
+                    continue
+                if not options['force'] and sidecar.read_sidecar(kind, path) is not None:
+                    skipped += 1
+                    continue
+                try:
+                    grade_cache.build_sidecar(kind, path)
+                    built += 1
+                except ValueError as e:
+                    failed += 1
+                    self.stderr.write(f"{consurf.uniprot_accession} {kind}: {e}")
+
+        if options['jobs']:
+            for job_id in ConsurfJob.objects.filter(status='completed').values_list("id", flat=True).iterator():
+                job_path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job_id))
+                if os.path.isdir(job_path):
+                    built += len(grade_cache.build_job_sidecars(job_path))
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} sidecars, {skipped} up to date, {failed} failed"))
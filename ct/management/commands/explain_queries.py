@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ct.models import CONSURFModel, ConsurfJob, ConsurfResidue
+from ct.views import ConsurfJobViewSet, ProteinFastaDatabaseViewSet, MultipleSequenceAlignmentViewSet, \
+    StructureFileViewSet, ConsurfResidueViewSet
+
+
+class Command(BaseCommand):
+    """
+    A command that prints the query plan of the main queries behind each viewset, built through the viewsets
+    themselves so that the plans follow the code. On postgres the queries are run with EXPLAIN ANALYZE.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=str, help='Username to run the user scoped queries as, '
+                                                     'defaults to the owner of the first job')
+        parser.add_argument('--search', type=str, default='test', help='Search term for the job search query')
+        parser.add_argument('--limit', type=int, default=10, help='Page size of the list queries')
+        parser.add_argument('--no-analyze', action='store_true', help='Only plan the queries, do not run them')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        self.factory = APIRequestFactory()
+        self.user = user
+        self.analyze = connection.vendor == 'postgresql' and not options['no_analyze']
+        limit = options['limit']
+        self.stdout.write(f"Running as {user.username} on {connection.vendor}")
+
+        rq_job_id = ConsurfJob.objects.exclude(rq_job_id=None).values_list('rq_job_id', flat=True).first() or ''
+        accession = CONSURFModel.objects.values_list('uniprot_accession', flat=True).first() or ''
+        queries = [
+            ("job list", self.list_queryset(ConsurfJobViewSet, {})[:limit]),
+            ("job list by status", self.list_queryset(ConsurfJobViewSet, {'status': 'completed'})[:limit]),
+            ("job search", self.list_queryset(ConsurfJobViewSet, {'search': options['search']})[:limit]),
+            ("active jobs", ConsurfJob.objects.filter(status__in=['pending', 'running']).order_by('-id')[:limit]),
+            ("job by rq id", ConsurfJob.objects.filter(rq_job_id=rq_job_id)),
+            ("fasta list", self.list_queryset(ProteinFastaDatabaseViewSet, {})[:limit]),
+            ("msa list", self.list_queryset(MultipleSequenceAlignmentViewSet, {})[:limit]),
+            ("structure list", self.list_queryset(StructureFileViewSet, {})[:limit]),
+            ("consurf by accession", CONSURFModel.objects.filter(uniprot_accession=accession)),
+            ("residues by grade", self.list_queryset(ConsurfResidueViewSet, {'color': '9', 'be': 'e'})[:limit]),
+            ("residue window", ConsurfResidue.objects.filter(uniprot_accession=accession, pos__gte=1, pos__lte=200)),
+        ]
+        for label, queryset in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(analyze=True) if self.analyze else queryset.explain())
+            self.stdout.write("")
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"User not found: {username}")
+            return user
+        user_id = ConsurfJob.objects.values_list('user_id', flat=True).order_by().first()
+        user = User.objects.filter(id=user_id).first() if user_id else User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError("No user found, pass --user")
+        return user
+
+    def list_queryset(self, viewset_class, params):
+        """The queryset the list action of viewset_class would paginate for a request with params."""
+        request = self.factory.get('/', params)
+        force_authenticate(request, user=self.user)
+        view = viewset_class(action_map={'get': 'list'}, format_kwarg=None, args=(), kwargs={})
+        view.request = view.initialize_request(request)
+        return view.filter_queryset(view.get_queryset())
@@ -4,7 +4,8 @@ from django.core.files import File
 from django.core.management import BaseCommand
 from django.db import transaction
 
-from ct.models import CONSURFModel
+from ct import grade_cache
+from ct.models import CONSURFModel, ConsurfResidue
 
 
 class Command(BaseCommand):
@@ -36,4 +37,7 @@ class Command(BaseCommand):
                                                        File(open(consurf_msa_variation, "rb")))
                     consurf.msa.save("input_msa.phy", File(open(os.path.join(root, dir, "input_msa.phy"), "rb")))
                     consurf.save()
+                    grade_cache.build_sidecar("grade", consurf.consurf_grade.path)
+                    grade_cache.build_sidecar("msa_variation", consurf.consurf_msa_variation.path)
+                    ConsurfResidue.objects.index_consurf(consurf)
 
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0021_proteinfastadatabase_blast_index_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsurfResidue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uniprot_accession', models.CharField(blank=True, max_length=20, null=True)),
+                ('pos', models.IntegerField()),
+                ('seq', models.CharField(max_length=1)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('grade', models.SmallIntegerField(blank=True, null=True)),
+                ('low_confidence', models.BooleanField(default=False)),
+                ('be', models.CharField(blank=True, max_length=1, null=True)),
+                ('function', models.CharField(blank=True, max_length=1, null=True)),
+                ('msa_hits', models.IntegerField(blank=True, null=True)),
+                ('msa_total', models.IntegerField(blank=True, null=True)),
+                ('residue_variety', models.CharField(blank=True, max_length=64, null=True)),
+                ('consurf', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='residues', to='ct.consurfmodel')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='residues', to='ct.consurfjob')),
+            ],
+            options={
+                'ordering': ['uniprot_accession', 'pos'],
+                'indexes': [models.Index(fields=['uniprot_accession', 'pos'], name='ct_residue_accession_pos'), models.Index(fields=['grade', 'be'], name='ct_residue_grade_be')],
+            },
+        ),
+    ]
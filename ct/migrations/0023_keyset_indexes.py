@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0022_consurfresidue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(fields=['user', '-id'], name='ct_job_user_id_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='ct_job_user_created_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='multiplesequencealignment',
+            index=models.Index(fields=['user', 'id'], name='ct_msa_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='proteinfastadatabase',
+            index=models.Index(fields=['user', 'id'], name='ct_fasta_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='structurefile',
+            index=models.Index(fields=['user', 'id'], name='ct_structure_user_id'),
+        ),
+    ]
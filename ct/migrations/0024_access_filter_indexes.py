@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0023_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multiplesequencealignment',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['id'], name='ct_msa_public'),
+        ),
+        migrations.AddIndex(
+            model_name='proteinfastadatabase',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['id'], name='ct_fasta_public'),
+        ),
+        migrations.AddIndex(
+            model_name='structurefile',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['id'], name='ct_structure_public'),
+        ),
+    ]
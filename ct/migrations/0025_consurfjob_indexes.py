@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0024_access_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(fields=['user', 'status', '-id'], name='ct_job_user_status_id_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'running'])), fields=['-id'], name='ct_job_active'),
+        ),
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(fields=['rq_job_id'], name='ct_job_rq_job_id'),
+        ),
+    ]
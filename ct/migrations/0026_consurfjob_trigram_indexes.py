@@ -0,0 +1,42 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# SearchFilter runs icontains, which postgres evaluates as UPPER(column) LIKE UPPER('%term%'), so the trigram
+# indexes are built on the same expression. Other databases have no trigram support and are left as they are,
+# TrigramExtension does nothing on them either.
+#
+# pg_trgm is a trusted extension from postgres 13 on, so the database owner can create it. On older servers, or
+# when the migrating role does not own the database, a superuser has to run CREATE EXTENSION pg_trgm on the
+# database before migrating, this migration then finds it installed and only builds the indexes.
+TRIGRAM_INDEXES = {
+    "ct_job_title_trgm": "job_title",
+    "ct_job_accession_trgm": "uniprot_accession",
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "ct_consurfjob" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0025_consurfjob_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0026_consurfjob_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consurfjob',
+            name='result_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='consurfjob',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['result_key', '-id'], name='ct_job_result_key'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ct', '0027_consurfjob_result_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='consurfjob',
+            name='ct_job_user_created_desc',
+        ),
+    ]
@@ -1,10 +1,19 @@
+import itertools
+import os
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.models import Session
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from contort import authentication
+from ct import counts, grade_cache, grade_filters, sidecar, typeahead
+
 class CONSURFModel(models.Model):
     """A data model for storing protein conservation data with the following column:
     - uniprot_accession: the UniProt accession number of the protein
@@ -27,10 +36,34 @@ class CONSURFModel(models.Model):
         return f"{self.uniprot_accession}"
 
     def delete(self, using=None, keep_parents=False):
+        for field in (self.consurf_grade, self.consurf_msa_variation):
+            if field:
+                sidecar.remove_sidecars(field.path)
         self.consurf_grade.delete()
         self.consurf_msa_variation.delete()
         super().delete(using=using, keep_parents=keep_parents)
 
+class SharedResourceQuerySet(models.QuerySet):
+    def shared_with_ids(self, user_id):
+        """Ids of the resources shared with user_id, read from the through table alone."""
+        shared_with = self.model._meta.get_field("shared_with")
+        return shared_with.remote_field.through.objects.filter(
+            **{f"{shared_with.m2m_reverse_field_name()}_id": user_id}
+        ).values(f"{shared_with.m2m_field_name()}_id")
+
+    def accessible_to(self, user):
+        """
+        Resources that user owns, that are public or that are shared with user. Sharing is checked with a
+        subquery on the through table that does not depend on the outer row, so the database runs it once and
+        probes its result as a hash, and as there is no join no row is repeated and no distinct is needed.
+        """
+        user_id = getattr(user, "id", user)
+        query = Q(is_public=True)
+        if user_id:
+            query |= Q(user_id=user_id) | Q(id__in=self.shared_with_ids(user_id))
+        return self.filter(query)
+
+
 class ProteinFastaDatabase(models.Model):
     INDEX_STATUS = [('none', 'None'), ('building', 'Building'), ('ready', 'Ready'), ('failed', 'Failed')]
 
@@ -43,6 +76,14 @@ class ProteinFastaDatabase(models.Model):
     blast_index_status = models.CharField(max_length=20, choices=INDEX_STATUS, default='none')
     mmseqs_index_status = models.CharField(max_length=20, choices=INDEX_STATUS, default='none')
 
+    objects = SharedResourceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="ct_fasta_user_id"),
+            models.Index(fields=["id"], condition=Q(is_public=True), name="ct_fasta_public"),
+        ]
+
 class MultipleSequenceAlignment(models.Model):
     name = models.CharField(max_length=255)
     msa_file = models.FileField(upload_to="msa_files")
@@ -51,6 +92,14 @@ class MultipleSequenceAlignment(models.Model):
     is_public = models.BooleanField(default=False)
     shared_with = models.ManyToManyField(User, related_name='shared_msas', blank=True)
 
+    objects = SharedResourceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="ct_msa_user_id"),
+            models.Index(fields=["id"], condition=Q(is_public=True), name="ct_msa_public"),
+        ]
+
 class StructureFile(models.Model):
     name = models.CharField(max_length=255)
     structure_file = models.FileField(upload_to="structure_files")
@@ -60,6 +109,14 @@ class StructureFile(models.Model):
     is_public = models.BooleanField(default=False)
     shared_with = models.ManyToManyField(User, related_name='shared_structures', blank=True)
 
+    objects = SharedResourceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="ct_structure_user_id"),
+            models.Index(fields=["id"], condition=Q(is_public=True), name="ct_structure_public"),
+        ]
+
 class ConsurfJob(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     job_title = models.CharField(max_length=255)
@@ -90,12 +147,192 @@ class ConsurfJob(models.Model):
     session_id = models.CharField(max_length=255, blank=True, null=True)
     rq_job_id = models.CharField(max_length=255, blank=True, null=True)
     is_nucleotide = models.BooleanField(default=False)
+    # hash of the inputs and parameters, jobs submitted with the same one reuse the outputs of a completed job
+    result_key = models.CharField(max_length=64, blank=True, null=True)
 
     class Meta:
         ordering = ["-id"]
         app_label = "ct"
+        indexes = [
+            models.Index(fields=["user", "-id"], name="ct_job_user_id_desc"),
+            models.Index(fields=["user", "status", "-id"], name="ct_job_user_status_id_desc"),
+            models.Index(fields=["-id"], condition=Q(status__in=["pending", "running"]), name="ct_job_active"),
+            models.Index(fields=["rq_job_id"], name="ct_job_rq_job_id"),
+            models.Index(fields=["result_key", "-id"], condition=Q(status="completed"), name="ct_job_result_key"),
+        ]
+
+class ConsurfResidueManager(models.Manager):
+    def replace_residues(self, df, batch_size=None, **fields):
+        """
+        Replace the residues of one consurf model or job, given as consurf= or job=, with the rows of its parsed
+        grade dataframe. Rows are inserted with bulk_create in chunks of batch_size.
+        """
+        batch_size = batch_size or settings.CONSURF_RESIDUE_BATCH_SIZE
+        with transaction.atomic():
+            self.filter(**fields).delete()
+            rows = ConsurfResidue.from_grades(df, **fields)
+            created = 0
+            while chunk := list(itertools.islice(rows, batch_size)):
+                self.bulk_create(chunk, batch_size=batch_size)
+                created += len(chunk)
+        # bulk_create and queryset deletes do not send the signals the cached counts rely on
+        counts.invalidate(ConsurfResidue)
+        return created
+
+    def index_consurf(self, consurf: CONSURFModel) -> int:
+        return self.replace_residues(grade_cache.read_cached("grade", consurf.consurf_grade.path), consurf=consurf)
+
+    def index_job(self, job: ConsurfJob) -> int:
+        job_path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id))
+        return self.replace_residues(grade_cache.read_cached_job_file("grade_new", job_path), job=job)
+
+
+class ConsurfResidue(models.Model):
+    """
+    One row per residue of a precomputed consurf model or of a completed job, so that conservation can be queried
+    across proteins without parsing the grade files:
+    - grade: the conservation grade from 1 (variable) to 9 (conserved)
+    - low_confidence: the grade was marked with * because there was not enough data
+    - be: b for buried or e for exposed, function: f for functional or s for structural
+    """
+    consurf = models.ForeignKey(CONSURFModel, on_delete=models.CASCADE, blank=True, null=True,
+                                related_name="residues")
+    job = models.ForeignKey(ConsurfJob, on_delete=models.CASCADE, blank=True, null=True, related_name="residues")
+    uniprot_accession = models.CharField(max_length=20, blank=True, null=True)
+    pos = models.IntegerField()
+    seq = models.CharField(max_length=1)
+    score = models.FloatField(blank=True, null=True)
+    grade = models.SmallIntegerField(blank=True, null=True)
+    low_confidence = models.BooleanField(default=False)
+    be = models.CharField(max_length=1, blank=True, null=True)
+    function = models.CharField(max_length=1, blank=True, null=True)
+    msa_hits = models.IntegerField(blank=True, null=True)
+    msa_total = models.IntegerField(blank=True, null=True)
+    residue_variety = models.CharField(max_length=64, blank=True, null=True)
+
+    objects = ConsurfResidueManager()
+
+    class Meta:
+        ordering = ["uniprot_accession", "pos"]
+        app_label = "ct"
+        indexes = [
+            models.Index(fields=["uniprot_accession", "pos"], name="ct_residue_accession_pos"),
+            models.Index(fields=["grade", "be"], name="ct_residue_grade_be"),
+        ]
+
+    def __str__(self):
+        return f"{self.uniprot_accession} {self.seq}{self.pos}"
+
+    @classmethod
+    def from_grades(cls, df, **fields):
+        """Build unsaved residues from a grade dataframe of either the webserver or the standalone layout."""
+        if "uniprot_accession" not in fields:
+            owner = fields.get("consurf") or fields.get("job")
+            fields["uniprot_accession"] = owner.uniprot_accession if owner else None
+        grades = grade_filters.grade_numbers(df["COLOR"])
+        for row, grade in zip(df.itertuples(index=False), grades.tolist()):
+            color = row.COLOR
+            msa_data = row.MSA_DATA if isinstance(row.MSA_DATA, list) else None
+            variety = row.RESIDUE_VARIETY if isinstance(row.RESIDUE_VARIETY, list) else None
+            yield cls(
+                pos=row.POS,
+                seq=row.SEQ,
+                score=None if row.SCORE != row.SCORE else row.SCORE,
+                grade=None if grade != grade else int(grade),
+                low_confidence=isinstance(color, str) and color.endswith("*"),
+                be=row.BE or None,
+                function=row.FUNCTION or None,
+                msa_hits=msa_data[0] if msa_data else None,
+                msa_total=msa_data[1] if msa_data else None,
+                residue_variety=",".join(variety)[:64] if variety else None,
+                **fields,
+            )
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_user(sender, instance=None, **kwargs):
+    authentication.invalidate(instance.key)
+
+
+@receiver(post_delete, sender=Session)
+def invalidate_session_user(sender, instance=None, **kwargs):
+    authentication.invalidate(instance.session_key)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, request=None, user=None, **kwargs):
+    session = getattr(request, "session", None)
+    if session is not None:
+        authentication.invalidate(session.session_key)
+
+
+@receiver(pre_save, sender=CONSURFModel)
+def invalidate_replaced_consurf_files(sender, instance=None, **kwargs):
+    if not instance.pk:
+        return
+    previous = CONSURFModel.objects.filter(pk=instance.pk).values("consurf_grade", "consurf_msa_variation").first()
+    if not previous:
+        return
+    for field in ("consurf_grade", "consurf_msa_variation"):
+        if previous[field] and previous[field] != getattr(instance, field).name:
+            grade_cache.invalidate(getattr(instance, field).storage.path(previous[field]))
+
+
+# job fields no listing filters on, saves of only these leave the cached counts as they are
+UNCOUNTED_JOB_FIELDS = {"log_data", "error_data", "process_cmd", "rq_job_id", "result_key", "updated_at"}
+
+
+@receiver(post_save, sender=CONSURFModel)
+@receiver(post_delete, sender=CONSURFModel)
+@receiver(post_save, sender=ConsurfJob)
+@receiver(post_delete, sender=ConsurfJob)
+@receiver(post_save, sender=ProteinFastaDatabase)
+@receiver(post_delete, sender=ProteinFastaDatabase)
+@receiver(post_save, sender=MultipleSequenceAlignment)
+@receiver(post_delete, sender=MultipleSequenceAlignment)
+@receiver(post_save, sender=StructureFile)
+@receiver(post_delete, sender=StructureFile)
+def invalidate_counts(sender, signal=None, created=False, update_fields=None, **kwargs):
+    if sender is ConsurfJob and signal is post_save and not created and update_fields \
+            and set(update_fields) <= UNCOUNTED_JOB_FIELDS:
+        # running jobs save their log tail every few seconds, which does not move them in or out of any listing
+        return
+    counts.invalidate(sender)
+    if signal is post_delete and sender in (CONSURFModel, ConsurfJob):
+        # their residues go with them through the cascade, which sends no signal for ConsurfResidue, saves leave
+        # them alone and replace_residues invalidates its own changes
+        counts.invalidate(ConsurfResidue)
+
+
+@receiver(m2m_changed, sender=ProteinFastaDatabase.shared_with.through)
+@receiver(m2m_changed, sender=MultipleSequenceAlignment.shared_with.through)
+@receiver(m2m_changed, sender=StructureFile.shared_with.through)
+def invalidate_shared_counts(sender, instance=None, action=None, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        counts.invalidate(type(instance) if not isinstance(instance, User) else kwargs["model"])
+
+
+@receiver(post_save, sender=CONSURFModel)
+@receiver(post_delete, sender=CONSURFModel)
+def invalidate_typeahead(sender, instance=None, **kwargs):
+    # rebuilding before the commit would read the old rows back into the index
+    transaction.on_commit(typeahead.invalidate)
+
+
+@receiver(post_delete, sender=CONSURFModel)
+def invalidate_deleted_consurf_files(sender, instance=None, **kwargs):
+    for field in (instance.consurf_grade, instance.consurf_msa_variation):
+        if field:
+            grade_cache.invalidate(field.path)
+
+
+@receiver(pre_delete, sender=ConsurfJob)
+def invalidate_deleted_job_files(sender, instance=None, **kwargs):
+    grade_cache.invalidate_directory(os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(instance.id)))
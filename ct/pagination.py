@@ -0,0 +1,52 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+from ct import counts
+
+
+class CachedCountLimitOffsetPagination(LimitOffsetPagination):
+    """LimitOffsetPagination that takes the total from the counting layer instead of a COUNT(*) per page."""
+    def get_count(self, queryset):
+        if hasattr(queryset, "model") and hasattr(queryset, "query"):
+            return counts.count(queryset)
+        return super().get_count(queryset)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the view ordering, "-id" when the view does not set one. Every page is an index range
+    scan from the last row of the previous page, so deep pages cost the same as the first one.
+    """
+    ordering = "-id"
+    page_size_query_param = "limit"
+    max_page_size = 1000
+
+
+class OptionalKeysetPagination(CachedCountLimitOffsetPagination):
+    """
+    Limit/offset pagination by default, keyset pagination when the request asks for it with ?pagination=cursor.
+    The next and previous links of a keyset page carry a cursor and stay in keyset mode.
+    """
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.keyset = None
+
+    def use_keyset(self, request) -> bool:
+        return request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
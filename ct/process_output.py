@@ -0,0 +1,42 @@
+import codecs
+import os
+import selectors
+import time
+
+READ_SIZE = 65536
+
+
+def iter_process_output(process, flush_interval: float, heartbeat_interval: float):
+    """
+    Wait on the stdout and stderr pipes of process and yield (stdout, stderr) with the text received since the
+    previous yield. Output that arrives after a quiet spell is yielded straight away, after that at most once every
+    flush_interval seconds. When nothing arrives, ("", "") is yielded every heartbeat_interval seconds. Ends once
+    both pipes are closed, after yielding what is left.
+    """
+    pending = {"stdout": [], "stderr": []}
+    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in pending}
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+        last_yield = time.monotonic()
+        while selector.get_map():
+            deadline = last_yield + (flush_interval if pending["stdout"] or pending["stderr"] else heartbeat_interval)
+            for key, _ in selector.select(max(0.0, deadline - time.monotonic())):
+                # the pipe is readable, so this returns whatever is buffered without blocking
+                chunk = os.read(key.fd, READ_SIZE)
+                text = decoders[key.data].decode(chunk, final=not chunk)
+                if text:
+                    pending[key.data].append(text)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+
+            now = time.monotonic()
+            has_pending = pending["stdout"] or pending["stderr"]
+            if now >= last_yield + (flush_interval if has_pending else heartbeat_interval):
+                yield "".join(pending["stdout"]), "".join(pending["stderr"])
+                pending["stdout"].clear()
+                pending["stderr"].clear()
+                last_yield = now
+
+    if pending["stdout"] or pending["stderr"]:
+        yield "".join(pending["stdout"]), "".join(pending["stderr"])
@@ -0,0 +1,262 @@
+import json
+import math
+import mimetypes
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from rest_framework import status
+from rest_framework.response import Response
+
+from ct import utils
+
+STREAM_CHUNK_ROWS = 500
+ZIP_MEMBER_CHUNK_SIZE = 64 * 1024
+
+_RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# same compact output as the default DRF JSONRenderer
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _fill(value):
+    # mirrors df.fillna("") without copying the dataframe
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+def _shortest_float64(values: np.ndarray) -> np.ndarray:
+    """
+    Widen float32 values to the float64 of their shortest decimal form, so 6.667 stored as float32 is sent as
+    6.667 rather than 6.666999816894531.
+    """
+    wide = values.astype(np.float64)
+    pending = np.flatnonzero(np.isfinite(wide) & (wide != 0))
+    if not len(pending):
+        return wide
+    magnitude = np.floor(np.log10(np.abs(wide[pending]))).astype(np.int64)
+    for digits in range(1, 10):
+        exponent = digits - 1 - magnitude
+        target = wide[pending]
+        scale = 10.0 ** np.abs(exponent)
+        candidate = np.where(exponent >= 0, np.round(target * scale) / scale, np.round(target / scale) * scale)
+        matched = candidate.astype(np.float32) == values[pending]
+        wide[pending[matched]] = candidate[matched]
+        pending, magnitude = pending[~matched], magnitude[~matched]
+        if not len(pending):
+            break
+    return wide
+
+
+def _column_array(series: pd.Series) -> np.ndarray:
+    values = series.to_numpy()
+    if values.dtype == np.float32:
+        return _shortest_float64(values)
+    return values
+
+
+def iter_record_chunks(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """Yield lists of row dicts, only materialising chunk_rows rows of each column at a time."""
+    names = [str(name) for name in df.columns]
+    columns = [_column_array(df[name]) for name in df.columns]
+    for start in range(0, len(df), chunk_rows):
+        values = [column[start:start + chunk_rows].tolist() for column in columns]
+        yield [dict(zip(names, map(_fill, row))) for row in zip(*values)]
+
+
+def iter_json_array(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS):
+    yield b"["
+    first = True
+    for rows in iter_record_chunks(df, chunk_rows):
+        body = ",".join(_encoder.encode(row) for row in rows)
+        yield (body if first else "," + body).encode()
+        first = False
+    yield b"]"
+
+
+def iter_ndjson(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS):
+    for rows in iter_record_chunks(df, chunk_rows):
+        yield "".join(_encoder.encode(row) + "\n" for row in rows).encode()
+
+
+def column_values(series: pd.Series) -> list:
+    values = _column_array(series).tolist()
+    if series.dtype.kind in "iub":
+        return values
+    return list(map(_fill, values))
+
+
+def records(df: pd.DataFrame) -> list[dict]:
+    """Same as df.fillna("").to_dict(orient="records") without copying the dataframe."""
+    return [row for rows in iter_record_chunks(df) for row in rows]
+
+
+def columns_dict(df: pd.DataFrame) -> dict:
+    """One list per column instead of one dict per residue, so the keys are only sent once."""
+    return {str(name): column_values(df[name]) for name in df.columns}
+
+
+def iter_json_columns(df: pd.DataFrame):
+    yield b"{"
+    for i, name in enumerate(df.columns):
+        prefix = "," if i else ""
+        yield f"{prefix}{_encoder.encode(str(name))}:{_encoder.encode(column_values(df[name]))}".encode()
+    yield b"}"
+
+
+def iter_batch_ndjson(results, layout: str = "records"):
+    """
+    Stream (uniprot_accession, dataframe, error) results as one JSON object per line, holding either the
+    per-residue data of the accession or the reason it could not be returned.
+    """
+    for accession, df, error in results:
+        if error is not None:
+            item = {"uniprot_accession": accession, "error": str(error)}
+        else:
+            item = {"uniprot_accession": accession, "data": columns_dict(df) if layout == "columns" else records(df)}
+        yield (_encoder.encode(item) + "\n").encode()
+
+
+def per_residue_response(request, df: pd.DataFrame):
+    """
+    Render per-residue data. By default the response is a list of records, ?layout=columns returns one array
+    per column instead. ?stream=json streams the same JSON chunk by chunk and ?stream=ndjson streams one
+    record per line, so the whole payload is never built in memory.
+    """
+    layout = request.query_params.get("layout", "records")
+    stream = request.query_params.get("stream")
+    if layout not in ("records", "columns"):
+        return Response({'error': 'layout must be records or columns'}, status=status.HTTP_400_BAD_REQUEST)
+    if stream not in (None, "", "json", "ndjson") or (layout == "columns" and stream == "ndjson"):
+        return Response({'error': 'stream must be json, or ndjson with the records layout'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if layout == "columns":
+        if stream:
+            return StreamingHttpResponse(iter_json_columns(df), content_type="application/json")
+        return Response(columns_dict(df))
+    if stream == "json":
+        return StreamingHttpResponse(iter_json_array(df), content_type="application/json")
+    if stream == "ndjson":
+        return StreamingHttpResponse(iter_ndjson(df), content_type="application/x-ndjson")
+    return Response(records(df))
+
+
+def zip_member_list(zip_path) -> list[dict]:
+    """Describe the members of a zip archive from its cached central directory."""
+    return [
+        {
+            "name": info.filename,
+            "size": info.file_size,
+            "compressed_size": info.compress_size,
+            "stored": info.compress_type == zipfile.ZIP_STORED,
+            "modified": "%04d-%02d-%02dT%02d:%02d:%02d" % info.date_time,
+        }
+        for info in utils.zip_directory(zip_path).values() if not info.is_dir()
+    ]
+
+
+def parse_range(header: str | None, size: int):
+    """
+    Return the (start, end) byte positions, end inclusive, asked for by a single range Range header. None means
+    the whole content should be sent and False that the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_HEADER.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def zip_member_response(request, zip_path, member_name: str):
+    """
+    Stream one member of a zip archive. Stored members are read straight from the archive and honour a single
+    Range header, compressed members are decompressed on the fly and always sent whole.
+    """
+    info = utils.zip_directory(zip_path).get(member_name)
+    if info is None or info.is_dir():
+        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    content_type = mimetypes.guess_type(member_name)[0] or "application/octet-stream"
+    file_name = member_name.rsplit("/", 1)[-1]
+    if info.compress_type == zipfile.ZIP_STORED:
+        byte_range = parse_range(request.headers.get("Range"), info.file_size)
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{info.file_size}"
+            return response
+        start, end = byte_range or (0, info.file_size - 1)
+        response = StreamingHttpResponse(
+            utils.iter_stored_zip_member(zip_path, member_name, start, end, ZIP_MEMBER_CHUNK_SIZE),
+            content_type=content_type,
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        )
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end}/{info.file_size}"
+            response["Content-Encoding"] = "identity"
+        response["Content-Length"] = str(end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+    else:
+        response = StreamingHttpResponse(_iter_zip_member(zip_path, member_name), content_type=content_type)
+        response["Content-Length"] = str(info.file_size)
+        response["Accept-Ranges"] = "none"
+    # member names come from the archive, the header quotes them or encodes them as RFC 5987
+    response["Content-Disposition"] = content_disposition_header(True, file_name)
+    return response
+
+
+def _iter_zip_member(zip_path, member_name: str):
+    with utils.open_zip_member(zip_path, member_name) as member:
+        while chunk := member.read(ZIP_MEMBER_CHUNK_SIZE):
+            yield chunk
+
+
+def file_range_response(request, f, content_type: str):
+    """
+    Stream a seekable binary file, honouring a single Range header. The file is closed once it has been sent.
+    """
+    size = f.seek(0, 2)
+    byte_range = parse_range(request.headers.get("Range"), size)
+    if byte_range is False:
+        f.close()
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        _iter_file_range(f, start, end),
+        content_type=content_type,
+        status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+    )
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        # GZipMiddleware leaves responses that have a Content-Encoding alone, a gzipped body would not match the
+        # offsets of Content-Range
+        response["Content-Encoding"] = "identity"
+    response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _iter_file_range(f, start: int, end: int):
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0 and (chunk := f.read(min(ZIP_MEMBER_CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            yield chunk
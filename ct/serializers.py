@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from ct.models import CONSURFModel, ProteinFastaDatabase, ConsurfJob, MultipleSequenceAlignment, StructureFile
+from ct.models import CONSURFModel, ProteinFastaDatabase, ConsurfJob, MultipleSequenceAlignment, StructureFile, \
+    ConsurfResidue
 
 
 class CONSURFModelSerializer(serializers.ModelSerializer):
@@ -42,6 +43,19 @@ class ConsurfJobSerializer(serializers.ModelSerializer):
     class Meta:
         model = ConsurfJob
         fields = '__all__'
+        read_only_fields = ['result_key']
+
+class ConsurfJobSummarySerializer(serializers.ModelSerializer):
+    """Every job field except the process output and command, which can be megabytes per job."""
+    class Meta:
+        model = ConsurfJob
+        exclude = ['log_data', 'error_data', 'process_cmd']
+
+class ConsurfResidueSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ConsurfResidue
+        fields = ['uniprot_accession', 'pos', 'seq', 'score', 'grade', 'low_confidence', 'be', 'function', 'msa_hits',
+                  'msa_total', 'residue_variety', 'consurf', 'job']
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,133 @@
+import json
+import math
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+SIDECAR_VERSION = 2
+
+# object column cells are tagged so that None and NaN survive the round trip
+_PRESENT, _NONE, _NAN = 0, 1, 2
+
+
+def sidecar_path(kind: str, source_path: str) -> str:
+    return f"{source_path}.{kind}.npz"
+
+
+def _source_signature(source_path: str) -> dict:
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _missing_state(value) -> int:
+    if value is None:
+        return _NONE
+    if isinstance(value, float) and math.isnan(value):
+        return _NAN
+    return _PRESENT
+
+
+def _encode_column(name: str, series: pd.Series, arrays: dict) -> dict:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        arrays[f"{name}/values"] = series.cat.codes.to_numpy()
+        arrays[f"{name}/categories"] = np.array(series.cat.categories.tolist(), dtype=str)
+        return {"name": name, "kind": "category"}
+    if series.dtype != object:
+        arrays[f"{name}/values"] = series.to_numpy()
+        return {"name": name, "kind": "numeric"}
+
+    values = series.tolist()
+    states = np.array([_missing_state(v) for v in values], dtype=np.int8)
+    present = [v for v, s in zip(values, states) if s == _PRESENT]
+    arrays[f"{name}/missing"] = states
+    if all(isinstance(v, str) for v in present):
+        arrays[f"{name}/values"] = np.array(present, dtype=str)
+        return {"name": name, "kind": "str"}
+    if all(isinstance(v, (tuple, list)) for v in present):
+        flat = [item for v in present for item in v]
+        arrays[f"{name}/values"] = np.array(flat) if flat else np.array([], dtype=str)
+        arrays[f"{name}/offsets"] = np.cumsum([0] + [len(v) for v in present], dtype=np.int64)
+        return {"name": name, "kind": "tuple" if present and isinstance(present[0], tuple) else "list"}
+    raise ValueError(f"Column {name} cannot be stored in a sidecar")
+
+
+def _decode_column(meta: dict, arrays: dict):
+    name = meta["name"]
+    values = arrays[f"{name}/values"]
+    if meta["kind"] == "numeric":
+        return values
+    if meta["kind"] == "category":
+        return pd.Categorical.from_codes(values, categories=arrays[f"{name}/categories"].tolist())
+
+    if meta["kind"] == "str":
+        present = values.tolist()
+    else:
+        offsets = arrays[f"{name}/offsets"]
+        flat = values.tolist()
+        widths = np.diff(offsets)
+        if len(widths) and (widths == widths[0]).all() and widths[0] > 0:
+            width = int(widths[0])
+            present = [flat[i:i + width] for i in range(0, len(flat), width)]
+        else:
+            present = [flat[s:e] for s, e in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        if meta["kind"] == "tuple":
+            present = list(map(tuple, present))
+
+    states = arrays[f"{name}/missing"]
+    if not states.any():
+        return present
+    present = iter(present)
+    return [next(present) if s == _PRESENT else (None if s == _NONE else float("nan")) for s in states.tolist()]
+
+
+def write_sidecar(kind: str, source_path: str, df: pd.DataFrame) -> str:
+    """
+    Store a parsed dataframe next to its source file as an uncompressed npz archive with one typed array per
+    column, so it can be loaded instead of parsed again.
+    """
+    arrays = {}
+    columns = [_encode_column(str(name), df[name], arrays) for name in df.columns]
+    meta = {"version": SIDECAR_VERSION, "kind": kind, "rows": len(df), "columns": columns,
+            "source": _source_signature(source_path)}
+    arrays["__meta__"] = np.array(json.dumps(meta))
+    path = sidecar_path(kind, source_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _load_arrays(path: str) -> dict:
+    """
+    Read every member of a sidecar. The dataframe built from them copies the columns anyway, so the arrays are
+    read into memory rather than mapped, and the file is closed before returning.
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def read_sidecar(kind: str, source_path: str) -> pd.DataFrame | None:
+    """Return the dataframe stored in the sidecar of source_path, or None when it is missing or out of date."""
+    path = sidecar_path(kind, source_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        arrays = _load_arrays(path)
+        meta = json.loads(str(arrays["__meta__"][()]))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    if meta.get("version") != SIDECAR_VERSION or meta.get("source") != _source_signature(source_path):
+        return None
+    return pd.DataFrame({column["name"]: _decode_column(column, arrays) for column in meta["columns"]})
+
+
+def remove_sidecars(source_path: str):
+    directory, name = os.path.split(source_path)
+    if not os.path.isdir(directory):
+        return
+    for file in os.listdir(directory):
+        if file.startswith(f"{name}.") and file.endswith(".npz"):
+            os.remove(os.path.join(directory, file))
@@ -7,7 +7,9 @@ import time
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django_rq import job
-from ct.models import ConsurfJob, ProteinFastaDatabase
+from ct import grade_cache, job_events, job_logs, job_results
+from ct.process_output import iter_process_output
+from ct.models import ConsurfJob, ConsurfResidue, ProteinFastaDatabase
 from django.conf import settings
 
 
@@ -30,6 +32,23 @@ def _send_db_index_ws(session_id: str, db_id: int, index_type: str, status: str,
     )
 
 
+def _send_job_ws(channel, session_id: str, consurf_job: ConsurfJob, message: str = '') -> None:
+    """
+    Send the job status. The log text itself goes out as log_delta messages while the job runs, so status messages
+    no longer have log_data and error_data, only log_length and error_length, the size of each log in bytes, which
+    a client can compare with what it holds before asking for a resync.
+    """
+    sizes = job_logs.log_sizes(consurf_job)
+    job_events.send(channel, session_id, {
+        'job_id': consurf_job.id,
+        'status': consurf_job.status,
+        'session_id': session_id,
+        'log_length': sizes['stdout'],
+        'error_length': sizes['stderr'],
+        'message': message
+    })
+
+
 @job('default', timeout=3600)
 def build_blast_index(db_id: int, session_id: str = ''):
     db = ProteinFastaDatabase.objects.get(id=db_id)
@@ -79,24 +98,40 @@ def build_mmseqs_index(db_id: int, session_id: str = ''):
     _send_db_index_ws(session_id, db_id, 'mmseqs', db.mmseqs_index_status, error)
 
 
+def _reuse_results(channel, session_id: str, consurf_job: ConsurfJob, reuse: bool) -> bool:
+    """
+    Complete the job with the outputs of an earlier job of the same user with the same inputs when reuse is set
+    and there is one. The result key is stored either way, so later jobs can reuse this one once it completes.
+    """
+    try:
+        consurf_job.result_key = job_results.result_key(consurf_job)
+    except OSError:
+        consurf_job.result_key = None
+    consurf_job.save(update_fields=['result_key', 'updated_at'])
+    if not reuse or not consurf_job.result_key:
+        return False
+    source = job_results.find_reusable(consurf_job.result_key, consurf_job.user_id)
+    if source is None:
+        return False
+    try:
+        job_results.reuse_outputs(source, consurf_job)
+    except OSError:
+        return False
+    try:
+        ConsurfResidue.objects.index_job(consurf_job)
+    except (OSError, ValueError):
+        pass
+    _send_job_ws(channel, session_id, consurf_job, f"Reused the results of job {source.id}")
+    return True
+
+
 @job('default', timeout=24*60*60)
-def run_consurf_job(job_id: int, session_id: str):
+def run_consurf_job(job_id: int, session_id: str, reuse: bool = False):
     channel = get_channel_layer()
     consurf_job = ConsurfJob.objects.get(id=job_id)
-    async_to_sync(channel.group_send)(
-        f'job_{session_id}',
-        {
-            'type': 'job_message',
-            'message': {
-                'job_id': job_id,
-                'status': consurf_job.status,
-                'session_id': session_id,
-                'log_data': "",
-                'error_data': "",
-                'message': "Job started"
-            }
-        }
-    )
+    if _reuse_results(channel, session_id, consurf_job, reuse):
+        return consurf_job.id
+    _send_job_ws(channel, session_id, consurf_job, "Job started")
     env = copy.deepcopy(os.environ)
     env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     env['VIRTUAL_ENV'] = os.getenv('VIRTUAL_ENV', '')
@@ -157,93 +192,36 @@ def run_consurf_job(job_id: int, session_id: str):
     consurf_job.process_cmd = " ".join(process.args)
     consurf_job.save()
 
-    os.set_blocking(process.stdout.fileno(), False)
-    os.set_blocking(process.stderr.fileno(), False)
-
-    stdout_chunks = []
-    stderr_chunks = []
-    stdout_eof = False
-    stderr_eof = False
-    last_ws_time = 0.0
-    heartbeat_interval = 5.0
-    save_count = 0
-    save_interval = 50
-
-    while not (stdout_eof and stderr_eof):
-        had_data = False
-
-        if not stdout_eof:
-            try:
-                chunk = os.read(process.stdout.fileno(), 4096)
-                if chunk:
-                    stdout_chunks.append(chunk.decode(errors='replace'))
-                    had_data = True
-                    save_count += 1
-                else:
-                    stdout_eof = True
-            except BlockingIOError:
-                pass
-
-        if not stderr_eof:
-            try:
-                chunk = os.read(process.stderr.fileno(), 4096)
-                if chunk:
-                    stderr_chunks.append(chunk.decode(errors='replace'))
-                    had_data = True
-                    save_count += 1
-                else:
-                    stderr_eof = True
-            except BlockingIOError:
-                pass
-
-        now = time.time()
-        if had_data or (now - last_ws_time >= heartbeat_interval):
-            last_ws_time = now
-            consurf_job.log_data = "".join(stdout_chunks)
-            consurf_job.error_data = "".join(stderr_chunks)
-            if save_count >= save_interval:
-                consurf_job.save()
-                save_count = 0
-            async_to_sync(channel.group_send)(
-                f'job_{session_id}',
-                {
-                    'type': 'job_message',
-                    'message': {
-                        'job_id': job_id,
-                        'status': consurf_job.status,
-                        'session_id': session_id,
-                        'log_data': consurf_job.log_data,
-                        'error_data': consurf_job.error_data,
-                        'message': ""
-                    }
-                }
-            )
-        elif not had_data:
-            time.sleep(0.1)
+    last_save = time.monotonic()
+    with job_logs.JobLogSink(job_path, settings.CONSURF_JOB_LOG_TAIL_SIZE) as sink:
+        for stdout, stderr in iter_process_output(process, settings.CONSURF_JOB_OUTPUT_FLUSH_INTERVAL,
+                                                  settings.CONSURF_JOB_HEARTBEAT_INTERVAL):
+            streams = sink.append({"stdout": stdout, "stderr": stderr})
+            # heartbeats are only sent live, the event stream keeps the deltas that carry output
+            job_events.send(channel, session_id, job_logs.delta_message(consurf_job, session_id, streams),
+                            store=bool(stdout or stderr))
+            now = time.monotonic()
+            if (stdout or stderr) and now - last_save >= settings.CONSURF_JOB_SAVE_INTERVAL:
+                # the row only keeps the tail, the whole log is in the files
+                consurf_job.log_data = sink.tail("stdout")
+                consurf_job.error_data = sink.tail("stderr")
+                consurf_job.save(update_fields=['log_data', 'error_data', 'updated_at'])
+                last_save = now
 
     process.wait()
 
-    consurf_job.log_data = "".join(stdout_chunks)
-    consurf_job.error_data = "".join(stderr_chunks)
+    consurf_job.log_data = sink.tail("stdout")
+    consurf_job.error_data = sink.tail("stderr")
     if os.path.exists(os.path.join(job_path, "Consurf_Outputs.zip")):
         consurf_job.status = 'completed'
+        grade_cache.build_job_sidecars(job_path)
+        try:
+            ConsurfResidue.objects.index_job(consurf_job)
+        except (OSError, ValueError):
+            pass
     else:
         consurf_job.status = 'failed'
 
-    async_to_sync(channel.group_send)(
-        f'job_{session_id}',
-        {
-            'type': 'job_message',
-            'message': {
-                'job_id': job_id,
-                'status': consurf_job.status,
-                'session_id': session_id,
-                'log_data': consurf_job.log_data,
-                'error_data': consurf_job.error_data,
-                'message': ""
-            }
-        }
-    )
-
     consurf_job.save()
+    _send_job_ws(channel, session_id, consurf_job)
     return consurf_job.id
@@ -1,9 +1,87 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from unittest import mock
+
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from ninja.testing import TestClient
 from django.test.client import MULTIPART_CONTENT, encode_multipart, BOUNDARY
+from django.utils import timezone
 from django.utils.datastructures import MultiValueDict
+from rest_framework.authtoken.models import Token
+
+from contort import authentication
+from ct import utils, counts, grade_cache, grade_filters, job_events, job_logs, job_results, sidecar, responses, \
+    tasks, typeahead
+from ct.process_output import iter_process_output
+from ct.models import CONSURFModel, ConsurfJob, ConsurfResidue, ProteinFastaDatabase, MultipleSequenceAlignment, \
+    StructureFile
+
+WEBSERVER_GRADES = """\t Amino Acid Conservation Scores
+\t=======================================
+
+- POS: The position of the AA in the SEQRES derived sequence.
+- SEQ: The SEQRES derived sequence in one letter code.
+- SCORE: The normalized conservation scores.
+- COLOR: The color scale representing the conservation scores (9 - conserved, 1 - variable).
+
+ POS\t SEQ\t    SCORE\t\tCOLOR\tCONFIDENCE INTERVAL\tCONFIDENCE INTERVAL COLORS\tMSA DATA\tRESIDUE VARIETY\tB/E\tFUNCTION
+    \t    \t(normalized)\t        \t               
+   1\t   M\t 0.653\t\t  4\t 0.164, 1.084\t\t    5,3\t\t\t  23/150\tM, L, V, I\te\tf
+   2\t   A\t-0.812\t\t  8*\t-1.030, -0.529\t\t    9,7\t\t\t   3/150\tA\tb\ts
+   3\t   K\t-1.234\t\t  9\t-1.401, -1.130\t\t    9,9\t\t\t 150/150\tK\te\tf
+   4\t   G\t 1.502\t\t  1\t 0.900,  2.110\t\t    2,1\t\t\t 140/150\tG, S, A, N, D, E\tb\t
+
+*Below the confidence cut-off - The calculations for this site were performed on less than 6 non-gaped homologue sequences,
+or the confidence interval for the estimated score is equal to- or larger than- 4 color grades.
+"""
+
+STANDALONE_GRADES = """\t Amino Acid Conservation Scores
+\t=======================================
+
+- POS: The position of the AA in the SEQRES derived sequence.
+- ATOM: The ATOM derived sequence in three letter code.
+
+ POS\t SEQ\t    ATOM\tSCORE\tCOLOR\tCONFIDENCE INTERVAL\tCONFIDENCE INTERVAL COLORS\tB/E\tFUNCTION\tMSA DATA\tRESIDUE VARIETY
+    \t    \t        \t(normalized)\t        \t               
+   1\t   M\t  MET1:A\t-0.733\t   7\t-1.030, -0.529\t    8,7\t     e\t     f\t   3/150\tM
+   2\t   S\t       -\t 1.020\t   2\t 0.410,  1.437\t    3,1\t      \t     \t  25/150\tS, A, T, N
+   3\t   P\t  PRO3:A\t 0.101\t   5\t-0.200,  0.400\t    6,4\t     b\t     s\t  80/150\tP, A
+
+*Below the confidence cut-off
+"""
+
+MSA_VARIATION = """\
+"The table details the residue variety in % for each position in the query sequence."
+"Each column shows the % for that amino-acid, found in position ('pos') in the MSA."
+"In case there are residues which are not a standard amino-acid in the MSA, they are represented under column 'OTHER'"
+
+pos,A,C,D,E,F,G,H,I,K,L,M,N,P,Q,R,S,T,V,W,Y,OTHER,MAX AA,ConSurf Grade
+1,,,,,,,,,,6.667,93.333,,,,,,,,,,,M,7
+2,81.25,,,,,6.25,,,,,,,,,,12.5,,,,,,A,8
+3,,,,,,,,,100,,,,,,,,,,,,,K,9
+"""
+
+
+def write_fixture(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, "wt") as f:
+        f.write(content)
+    return path
 
 
 # Create your tests here.
@@ -18,3 +96,977 @@ class CONSURFModelTestCase(TestCase):
             d = self.client.post('/api/consurf', {"uniprot_accession": "Q5S007", "consurf_grade": f, "consurf_msa_variation": g}, content_type=MULTIPART_CONTENT)
             print(d.content)
             assert d.status_code == 200
+
+
+class GradeParserTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.webserver_path = write_fixture(self.tmp.name, "consurf_grades.txt", WEBSERVER_GRADES)
+        self.standalone_path = write_fixture(self.tmp.name, "no_model_consurf_grades.txt", STANDALONE_GRADES)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_vectorized_matches_legacy_webserver(self):
+        legacy = utils.read_consurf_grade_file(self.webserver_path, engine="legacy")
+        vectorized = utils.read_consurf_grade_file(self.webserver_path, engine="vectorized")
+        pd.testing.assert_frame_equal(legacy, vectorized)
+        self.assertEqual(len(vectorized), 4)
+
+    def test_vectorized_matches_legacy_standalone(self):
+        legacy = utils.read_consurf_grade_file_new(self.standalone_path, engine="legacy")
+        vectorized = utils.read_consurf_grade_file_new(self.standalone_path, engine="vectorized")
+        pd.testing.assert_frame_equal(legacy, vectorized)
+        self.assertIsNone(vectorized.loc[1, "ATOM"])
+
+    def test_irregular_rows_match_legacy(self):
+        lines = STANDALONE_GRADES.splitlines(True)
+        lines.insert(9, "   4\t   W\t  TRP4\t-0.7334\t   7\t-1.030,-0.529\t    8,7\t   3/150\tW,F\n")
+        path = write_fixture(self.tmp.name, "irregular_grades.txt", "".join(lines))
+        pd.testing.assert_frame_equal(utils.read_consurf_grade_file_new(path, engine="legacy"),
+                                      utils.read_consurf_grade_file_new(path, engine="vectorized"))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            utils.read_consurf_grade_file(self.webserver_path, engine="fortran")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class GradeCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = write_fixture(self.tmp.name, "consurf_grades.txt", WEBSERVER_GRADES)
+        grade_cache.clear_local()
+
+    def tearDown(self):
+        grade_cache.invalidate(self.path)
+        self.tmp.cleanup()
+
+    def test_repeated_reads_hit_cache(self):
+        first = grade_cache.read_cached("grade", self.path)
+        second = grade_cache.read_cached("grade", self.path)
+        self.assertIs(first, second)
+        stats = grade_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_shared_cache_is_used_after_local_eviction(self):
+        grade_cache.read_cached("grade", self.path)
+        with override_settings(CONSURF_PARSE_CACHE_LOCAL_SIZE=0):
+            grade_cache.clear_local()
+            grade_cache.read_cached("grade", self.path)
+        self.assertEqual(grade_cache.stats()["shared_hits"], 1)
+
+    def test_modified_file_is_parsed_again(self):
+        grade_cache.read_cached("grade", self.path)
+        lines = WEBSERVER_GRADES.splitlines(True)
+        write_fixture(self.tmp.name, "consurf_grades.txt", "".join(lines[:13] + lines[14:]))
+        os.utime(self.path, ns=(0, 0))
+        df = grade_cache.read_cached("grade", self.path)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(grade_cache.stats()["misses"], 2)
+
+    def test_invalidate(self):
+        grade_cache.read_cached("grade", self.path)
+        grade_cache.invalidate(self.path)
+        grade_cache.read_cached("grade", self.path)
+        self.assertEqual(grade_cache.stats()["misses"], 2)
+
+    def test_read_cached_many_keeps_order(self):
+        missing = os.path.join(self.tmp.name, "missing.txt")
+        results = list(grade_cache.read_cached_many("grade", [("a", self.path), ("b", missing), ("c", self.path)],
+                                                    workers=2))
+        self.assertEqual([key for key, _, _ in results], ["a", "b", "c"])
+        self.assertEqual(len(results[0][1]), 4)
+        self.assertIsNone(results[1][1])
+        self.assertIsInstance(results[1][2], FileNotFoundError)
+
+    def test_read_cached_many_bounds_reads_in_flight(self):
+        started = []
+        with mock.patch.object(grade_cache, "read_cached", side_effect=lambda kind, path: started.append(path)):
+            results = grade_cache.read_cached_many("grade", ((str(i), str(i)) for i in range(20)), workers=2)
+            next(results)
+            self.assertLessEqual(len(started), 5)
+            self.assertEqual([key for key, _, _ in results], [str(i) for i in range(1, 20)])
+        self.assertEqual(len(started), 20)
+
+
+class SidecarTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.webserver_path = write_fixture(self.tmp.name, "consurf_grades.txt", WEBSERVER_GRADES)
+        self.standalone_path = write_fixture(self.tmp.name, "no_model_consurf_grades.txt", STANDALONE_GRADES)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        for kind, path in (("grade", self.webserver_path), ("grade_new", self.standalone_path)):
+            df = grade_cache.READERS[kind](path)
+            sidecar.write_sidecar(kind, path, df)
+            pd.testing.assert_frame_equal(sidecar.read_sidecar(kind, path), df)
+
+    def test_stale_sidecar_is_ignored(self):
+        grade_cache.build_sidecar("grade", self.webserver_path)
+        with open(self.webserver_path, "at") as f:
+            f.write("\n")
+        self.assertIsNone(sidecar.read_sidecar("grade", self.webserver_path))
+
+    def test_remove_sidecars(self):
+        path = grade_cache.build_sidecar("grade", self.webserver_path)
+        sidecar.remove_sidecars(self.webserver_path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(self.webserver_path))
+
+
+class MsaVariationParserTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = write_fixture(self.tmp.name, "msa_aa_variety_percentage.csv", MSA_VARIATION)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_typed_dtypes(self):
+        df = utils.read_consurf_msa_variation_file(self.path, engine="typed")
+        self.assertTrue((df[utils.MSA_VARIATION_AMINO_ACIDS].dtypes == "float32").all())
+        self.assertIsInstance(df["MAX_AA"].dtype, pd.CategoricalDtype)
+        self.assertEqual(df["ConSurf_Grade"].tolist(), ["7", "8", "9"])
+        self.assertFalse(df[utils.MSA_VARIATION_AMINO_ACIDS].isna().any().any())
+
+    def test_typed_renders_like_legacy(self):
+        legacy = utils.read_consurf_msa_variation_file(self.path, engine="legacy")
+        typed = utils.read_consurf_msa_variation_file(self.path, engine="typed")
+        self.assertEqual(json.dumps(responses.records(typed)), json.dumps(legacy.fillna("").to_dict(orient="records")))
+        self.assertEqual(json.dumps(responses.columns_dict(typed)), json.dumps(responses.columns_dict(legacy)))
+
+    def test_sidecar_round_trip(self):
+        df = utils.read_consurf_msa_variation_file(self.path)
+        sidecar.write_sidecar("msa_variation", self.path, df)
+        pd.testing.assert_frame_equal(sidecar.read_sidecar("msa_variation", self.path), df)
+
+
+class GradeFilterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.webserver = utils.read_consurf_grade_file(write_fixture(self.tmp.name, "consurf_grades.txt",
+                                                                     WEBSERVER_GRADES))
+        self.standalone = utils.read_consurf_grade_file_new(write_fixture(self.tmp.name, "no_model_consurf_grades.txt",
+                                                                          STANDALONE_GRADES))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def select(self, df, **params):
+        return grade_filters.apply_grade_filter(df, grade_filters.parse_grade_filter(params))["POS"].tolist()
+
+    def test_position_window(self):
+        self.assertEqual(self.select(self.webserver, pos_from="2", pos_to="3"), [2, 3])
+        self.assertEqual(self.select(self.webserver, pos_from="3"), [3, 4])
+        self.assertEqual(self.select(self.webserver, pos_to="1"), [1])
+        shuffled = self.webserver.iloc[[2, 0, 3, 1]]
+        self.assertEqual(self.select(shuffled, pos_from="2", pos_to="3"), [3, 2])
+
+    def test_filters(self):
+        self.assertEqual(self.select(self.webserver, color="8,9"), [2, 3])
+        self.assertEqual(self.select(self.standalone, color="7"), [1])
+        self.assertEqual(self.select(self.standalone, be="b", function="s"), [3])
+        self.assertEqual(self.select(self.standalone, pos_from="2", be="e"), [])
+
+    def test_no_filter_returns_same_frame(self):
+        self.assertIs(grade_filters.apply_grade_filter(self.webserver, grade_filters.parse_grade_filter({})),
+                      self.webserver)
+
+    def test_invalid_parameters(self):
+        for params in ({"pos_from": "x"}, {"pos_from": "5", "pos_to": "1"}, {"color": "10"}, {"be": "x"}):
+            with self.assertRaises(ValueError):
+                grade_filters.parse_grade_filter(params)
+
+
+class ConsurfResidueTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = utils.read_consurf_grade_file(write_fixture(self.tmp.name, "consurf_grades.txt", WEBSERVER_GRADES))
+        self.consurf = CONSURFModel.objects.create(uniprot_accession="Q5S007")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replace_residues(self):
+        self.assertEqual(ConsurfResidue.objects.replace_residues(self.df, batch_size=3, consurf=self.consurf), 4)
+        self.assertEqual(ConsurfResidue.objects.replace_residues(self.df, batch_size=3, consurf=self.consurf), 4)
+        residue = ConsurfResidue.objects.get(consurf=self.consurf, pos=2)
+        self.assertEqual((residue.uniprot_accession, residue.seq, residue.grade, residue.low_confidence),
+                         ("Q5S007", "A", 8, True))
+        self.assertEqual((residue.msa_hits, residue.msa_total, residue.be, residue.function), (3, 150, "b", "s"))
+
+    def test_query_endpoint(self):
+        ConsurfResidue.objects.replace_residues(self.df, consurf=self.consurf)
+        response = self.client.get("/api/residue/", {"color": "8,9", "be": "e"})
+        self.assertEqual([r["pos"] for r in response.json()["results"]], [3])
+        response = self.client.get("/api/residue/counts/", {"pos_from": "2"})
+        self.assertEqual(response.json()["results"], [{"uniprot_accession": "Q5S007", "count": 3}])
+        self.assertEqual(self.client.get("/api/residue/", {"be": "x"}).status_code, 400)
+        residue = ConsurfResidue.objects.get(consurf=self.consurf, pos=1)
+        response = self.client.get(f"/api/residue/{residue.id}/", {"be": "x"})
+        self.assertEqual((response.status_code, response.json()["pos"]), (200, 1))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TypeaheadTestCase(TestCase):
+    def setUp(self):
+        for accession in ("Q5S007", "P12345", "Q5S00A", "Q9XYZ1", "Q5S001"):
+            CONSURFModel.objects.create(uniprot_accession=accession)
+
+    def test_prefix_search(self):
+        self.assertEqual(typeahead.search("Q5S"), ["Q5S001", "Q5S007", "Q5S00A"])
+        self.assertEqual(typeahead.search("Q5S", limit=2), ["Q5S001", "Q5S007"])
+        self.assertEqual(typeahead.search("Z"), [])
+        self.assertEqual(self.client.get("/api/consurf/typeahead/Q9/").json(), ["Q9XYZ1"])
+
+    def test_index_follows_model_changes(self):
+        self.assertEqual(typeahead.search("P"), ["P12345"])
+        with self.captureOnCommitCallbacks(execute=True):
+            CONSURFModel.objects.create(uniprot_accession="P00001")
+        self.assertEqual(typeahead.search("P"), ["P00001", "P12345"])
+        with self.captureOnCommitCallbacks(execute=True):
+            CONSURFModel.objects.get(uniprot_accession="P12345").delete()
+            self.assertEqual(typeahead.search("P"), ["P00001", "P12345"])
+        self.assertEqual(typeahead.search("P"), ["P00001"])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CountTestCase(TestCase):
+    def setUp(self):
+        for accession in ("Q5S007", "P12345"):
+            CONSURFModel.objects.create(uniprot_accession=accession)
+
+    def test_count_is_cached_until_rows_change(self):
+        self.assertEqual(counts.count(CONSURFModel.objects.all()), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(counts.count(CONSURFModel.objects.all()), 2)
+            self.assertEqual(self.client.get("/api/consurf/count/").json(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            CONSURFModel.objects.create(uniprot_accession="Q9XYZ1")
+            self.assertEqual(counts.count(CONSURFModel.objects.all()), 2)
+        self.assertEqual(counts.count(CONSURFModel.objects.all()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            CONSURFModel.objects.get(uniprot_accession="P12345").delete()
+        self.assertEqual(counts.count(CONSURFModel.objects.all()), 2)
+
+    def test_filtered_counts_are_separate(self):
+        self.assertEqual(counts.count(CONSURFModel.objects.filter(uniprot_accession__startswith="Q")), 1)
+        self.assertEqual(counts.count(CONSURFModel.objects.none()), 0)
+        self.assertEqual(counts.count(CONSURFModel.objects.all()), 2)
+
+    def test_log_saves_keep_job_counts(self):
+        job = ConsurfJob.objects.create(user=User.objects.create_user("runner"), job_title="running")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(counts.count(ConsurfJob.objects.all()), 1)
+            job.log_data = "output"
+            job.save(update_fields=["log_data", "error_data", "updated_at"])
+        with self.assertNumQueries(0):
+            self.assertEqual(counts.count(ConsurfJob.objects.all()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            job.status = "completed"
+            job.save(update_fields=["status"])
+        with self.assertNumQueries(1):
+            counts.count(ConsurfJob.objects.all())
+
+    def test_parameters_are_part_of_the_key(self):
+        self.assertEqual(counts.count(CONSURFModel.objects.filter(uniprot_accession__in=["Q5S007", "P12345"])), 2)
+        self.assertEqual(counts.count(CONSURFModel.objects.filter(uniprot_accession__in=["Q5S007, P12345"])), 0)
+
+    def test_paginated_list_uses_cached_count(self):
+        self.client.force_login(User.objects.create_user("counter"))
+        self.assertEqual(self.client.get("/api/consurf/", {"limit": 1}).json()["count"], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/api/consurf/", {"limit": 1}).json()["count"], 2)
+        self.assertFalse([q for q in queries.captured_queries if "COUNT(" in q["sql"]])
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("pager")
+        self.client.force_login(self.user)
+        for i in range(5):
+            ConsurfJob.objects.create(user=self.user, job_title=f"job {i}")
+
+    def test_offset_pagination_is_default(self):
+        body = self.client.get("/api/job/", {"limit": 2}).json()
+        self.assertEqual(body["count"], 5)
+        self.assertEqual([job["job_title"] for job in body["results"]], ["job 4", "job 3"])
+
+    def test_cursor_pages_follow_each_other(self):
+        titles = []
+        url, params = "/api/job/", {"pagination": "cursor", "limit": 2}
+        while url:
+            body = self.client.get(url, params).json()
+            self.assertNotIn("count", body)
+            titles += [job["job_title"] for job in body["results"]]
+            url, params = body["next"], None
+        self.assertEqual(titles, [f"job {i}" for i in range(4, -1, -1)])
+
+
+class JobListTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("lister")
+        self.client.force_login(self.user)
+        self.job = ConsurfJob.objects.create(user=self.user, job_title="big", log_data="x" * 100000,
+                                             error_data="warning", process_cmd="consurf --seq q.fasta")
+
+    def test_list_leaves_out_process_output(self):
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get("/api/job/").json()
+        self.assertNotIn("log_data", body["results"][0])
+        self.assertEqual(body["results"][0]["job_title"], "big")
+        self.assertFalse([q for q in queries.captured_queries if '"log_data"' in q["sql"]])
+        self.assertIn("log_data", self.client.get(f"/api/job/{self.job.id}/").json())
+
+    def test_log_endpoint(self):
+        body = self.client.get(f"/api/job/{self.job.id}/log/").json()
+        self.assertEqual((len(body["log_data"]), body["error_data"]), (100000, "warning"))
+        body = self.client.get(f"/api/job/{self.job.id}/log/", {"field": "error_data"}).json()
+        self.assertEqual(body, {"id": self.job.id, "status": "pending", "error_data": "warning"})
+        self.assertEqual(self.client.get(f"/api/job/{self.job.id}/log/", {"field": "user"}).status_code, 400)
+
+    def test_cancel_message_leaves_the_log_alone(self):
+        ConsurfJob.objects.filter(id=self.job.id).update(session_id="session", rq_job_id="rq")
+        with mock.patch("ct.views.django_rq.get_queue"), mock.patch.object(job_events, "send") as send:
+            self.assertEqual(self.client.post(f"/api/job/{self.job.id}/cancel/").status_code, 200)
+        message = send.call_args.args[2]
+        self.assertEqual(message["status"], "cancelled")
+        self.assertNotIn("log_data", message)
+        self.assertNotIn("error_data", message)
+
+
+class ListQueryCountTestCase(TestCase):
+    """Fails when the number of queries of a list endpoint grows with the number of rows on the page."""
+    def setUp(self):
+        self.user = User.objects.create_user("owner")
+        self.others = [User.objects.create_user(f"reader{i}") for i in range(3)]
+        self.client.force_login(self.user)
+
+    def create_fasta(self, i):
+        item = ProteinFastaDatabase.objects.create(name=f"db{i}", fasta_file="db.fasta", user=self.user)
+        item.shared_with.set(self.others)
+
+    def create_msa(self, i):
+        item = MultipleSequenceAlignment.objects.create(name=f"msa{i}", msa_file="a.fasta", user=self.user)
+        item.shared_with.set(self.others)
+
+    def create_structure(self, i):
+        item = StructureFile.objects.create(name=f"s{i}", structure_file="s.pdb", user=self.user)
+        item.shared_with.set(self.others)
+
+    def create_job(self, i):
+        ConsurfJob.objects.create(user=self.user, job_title=f"job {i}")
+
+    def list_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"limit": 100})
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assertQueryCountIsConstant(self, url, create):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(2):
+                create(i)
+        small = self.list_queries(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(2, 20):
+                create(i)
+        self.assertEqual(self.list_queries(url), small, f"{url} issues more queries for a bigger page")
+
+    def test_list_endpoints(self):
+        for url, create in (("/api/fasta/", self.create_fasta), ("/api/msa/", self.create_msa),
+                            ("/api/structure/", self.create_structure), ("/api/job/", self.create_job)):
+            with self.subTest(url=url):
+                self.assertQueryCountIsConstant(url, create)
+
+    def test_shared_with_usernames(self):
+        self.create_fasta(0)
+        result = self.client.get("/api/fasta/").json()["results"][0]
+        self.assertEqual(sorted(result["shared_with_usernames"]), ["reader0", "reader1", "reader2"])
+
+
+class AccessFilterTestCase(TestCase):
+    def test_accessible_to(self):
+        owner, reader, stranger = (User.objects.create_user(name) for name in ("owner", "reader", "stranger"))
+        ProteinFastaDatabase.objects.create(name="own", fasta_file="a.fasta", user=owner)
+        ProteinFastaDatabase.objects.create(name="public", fasta_file="b.fasta", user=owner, is_public=True)
+        shared = ProteinFastaDatabase.objects.create(name="shared", fasta_file="c.fasta", user=owner)
+        shared.shared_with.set([reader, stranger])
+
+        def names(user):
+            return sorted(ProteinFastaDatabase.objects.accessible_to(user).values_list("name", flat=True))
+
+        self.assertEqual(names(owner), ["own", "public", "shared"])
+        self.assertEqual(names(reader), ["public", "shared"])
+        shared.shared_with.remove(stranger)
+        self.assertEqual(names(stranger), ["public"])
+        self.assertEqual(names(None), ["public"])
+
+
+class StreamingResponseTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = write_fixture(self.tmp.name, "no_model_consurf_grades.txt", STANDALONE_GRADES)
+        self.df = utils.read_consurf_grade_file_new(path)
+        self.expected = json.loads(json.dumps(self.df.fillna("").to_dict(orient="records")))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_json_array_matches_records(self):
+        body = b"".join(responses.iter_json_array(self.df, chunk_rows=2))
+        self.assertEqual(json.loads(body), self.expected)
+
+    def test_ndjson_matches_records(self):
+        body = b"".join(responses.iter_ndjson(self.df, chunk_rows=2)).decode()
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected)
+
+    def test_empty_frame(self):
+        self.assertEqual(json.loads(b"".join(responses.iter_json_array(self.df.iloc[:0]))), [])
+
+    def test_columns_layout_matches_records(self):
+        columns = json.loads(json.dumps(responses.columns_dict(self.df)))
+        self.assertEqual(list(columns), list(self.expected[0]))
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        self.assertEqual(rows, self.expected)
+        self.assertEqual(json.loads(b"".join(responses.iter_json_columns(self.df))), columns)
+
+    def test_columns_layout_size(self):
+        df = pd.concat([self.df] * 2000, ignore_index=True)
+        records_body = json.dumps(df.fillna("").to_dict(orient="records"), separators=(",", ":"))
+        columns_body = json.dumps(responses.columns_dict(df), separators=(",", ":"))
+        self.assertLess(len(columns_body), len(records_body) * 0.75)
+
+
+class GradeBatchTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.tmp.name)
+        self.settings.enable()
+        grade_cache.clear_local()
+        self.paths = {}
+        for accession in ("P00001", "P00002"):
+            consurf = CONSURFModel.objects.create(uniprot_accession=accession)
+            consurf.consurf_grade.save("consurf_grades.txt", ContentFile(WEBSERVER_GRADES))
+            self.paths[accession] = consurf.consurf_grade.path
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp.cleanup()
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    def test_batch_endpoint(self):
+        lines = self.lines(self.client.get("/api/consurf/consurf_grade_batch/",
+                                           {"accessions": "P00002,Q00000,P00001", "color": "9"}))
+        self.assertEqual([line["uniprot_accession"] for line in lines], ["P00002", "Q00000", "P00001"])
+        self.assertEqual([r["POS"] for r in lines[0]["data"]], [3])
+        self.assertEqual(lines[1], {"uniprot_accession": "Q00000", "error": "not found"})
+        self.assertEqual(self.client.get("/api/consurf/consurf_grade_batch/", {"color": "x"}).status_code, 400)
+
+    def test_unexpected_read_error_is_reported_per_accession(self):
+        read_cached = grade_cache.read_cached
+
+        def read(kind, file_path):
+            if file_path == self.paths["P00001"]:
+                raise KeyError("POS")
+            return read_cached(kind, file_path)
+
+        with mock.patch.object(grade_cache, "read_cached", side_effect=read):
+            lines = self.lines(self.client.post("/api/consurf/consurf_grade_batch/",
+                                                {"accessions": ["P00001", "P00002"]}, content_type="application/json"))
+        self.assertEqual(lines[0], {"uniprot_accession": "P00001", "error": "grade file could not be read"})
+        self.assertEqual(len(lines[1]["data"]), 4)
+
+
+class ZipReaderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.grade_path = write_fixture(self.tmp.name, "no_model_consurf_grades.txt", STANDALONE_GRADES)
+        self.zip_path = os.path.join(self.tmp.name, "Consurf_Outputs.zip")
+        with zipfile.ZipFile(self.zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("query.fasta", ">query\nMSP\n")
+            archive.write(self.grade_path, "no_model_consurf_grades.txt")
+            archive.writestr("model.pdb", "ATOM 0123456789", compress_type=zipfile.ZIP_STORED)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_grade_from_zip(self):
+        pd.testing.assert_frame_equal(utils.read_consurf_grade_from_zip(self.zip_path),
+                                      utils.read_consurf_grade_file_new(self.grade_path))
+
+    def test_bytes_input(self):
+        pd.testing.assert_frame_equal(utils.read_consurf_grade_file_new(STANDALONE_GRADES.encode()),
+                                      utils.read_consurf_grade_file_new(self.grade_path))
+
+    def test_central_directory_is_cached(self):
+        utils.zip_directory(self.zip_path)
+        hits = utils._zip_directory.cache_info().hits
+        utils.read_consurf_grade_from_zip(self.zip_path)
+        self.assertGreater(utils._zip_directory.cache_info().hits, hits)
+
+    def test_member_opens_do_not_read_the_directory_again(self):
+        utils._zip_directory.cache_clear()
+        with mock.patch.object(zipfile.ZipFile, "_RealGetContents", autospec=True,
+                               side_effect=zipfile.ZipFile._RealGetContents) as read_directory:
+            for _ in range(3):
+                with utils.open_zip_member(self.zip_path, "no_model_consurf_grades.txt") as member:
+                    self.assertEqual(member.read().decode(), STANDALONE_GRADES)
+                with utils.open_zip_member(self.zip_path, "model.pdb") as member:
+                    member.seek(5)
+                    self.assertEqual(member.read(4), b"0123")
+        self.assertEqual(read_directory.call_count, 1)
+
+    def test_invalidate_drops_member_entries(self):
+        grade_cache.clear_local()
+        grade_cache.read_cached_member("grade_new", self.zip_path, "no_model_consurf_grades.txt")
+        grade_cache.invalidate(self.zip_path)
+        misses = grade_cache.stats()["misses"]
+        grade_cache.read_cached_member("grade_new", self.zip_path, "no_model_consurf_grades.txt")
+        self.assertEqual(grade_cache.stats()["misses"], misses + 1)
+
+    def test_member_name_in_content_disposition(self):
+        with zipfile.ZipFile(self.zip_path, "a") as archive:
+            archive.writestr('out/a";b é.txt', "x")
+        response = responses.zip_member_response(Client().get("/").wsgi_request, self.zip_path, 'out/a";b é.txt')
+        self.assertEqual(response["Content-Disposition"], "attachment; filename*=utf-8''a%22%3Bb%20%C3%A9.txt")
+
+    def test_missing_member(self):
+        with self.assertRaises(FileNotFoundError):
+            utils.open_zip_member(self.zip_path, "missing.txt")
+
+    def test_stored_member_range(self):
+        self.assertEqual(b"".join(utils.iter_stored_zip_member(self.zip_path, "model.pdb", 5, 8, chunk_size=2)), b"0123")
+        self.assertEqual(b"".join(utils.iter_stored_zip_member(self.zip_path, "model.pdb")), b"ATOM 0123456789")
+        with self.assertRaises(ValueError):
+            next(utils.iter_stored_zip_member(self.zip_path, "no_model_consurf_grades.txt"))
+
+    def test_parse_range(self):
+        self.assertIsNone(responses.parse_range(None, 15))
+        self.assertEqual(responses.parse_range("bytes=5-8", 15), (5, 8))
+        self.assertEqual(responses.parse_range("bytes=10-", 15), (10, 14))
+        self.assertEqual(responses.parse_range("bytes=-3", 15), (12, 14))
+        self.assertEqual(responses.parse_range("bytes=5-99", 15), (5, 14))
+        self.assertIs(responses.parse_range("bytes=15-", 15), False)
+        self.assertIsNone(responses.parse_range("bytes=0-1,4-5", 15))
+
+
+class ProcessOutputTestCase(SimpleTestCase):
+    def run_script(self, script, flush_interval=0.05, heartbeat_interval=5.0):
+        process = subprocess.Popen([sys.executable, "-u", "-c", script],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        batches = list(iter_process_output(process, flush_interval, heartbeat_interval))
+        process.wait()
+        return batches
+
+    def test_collects_both_pipes(self):
+        batches = self.run_script("import sys\nprint('out')\nprint('err', file=sys.stderr)\nprint('é' * 40000)")
+        self.assertEqual("".join(b[0] for b in batches), "out\n" + "é" * 40000 + "\n")
+        self.assertEqual("".join(b[1] for b in batches), "err\n")
+
+    def test_heartbeat_while_quiet(self):
+        batches = self.run_script("import time\ntime.sleep(0.5)\nprint('done')", heartbeat_interval=0.1)
+        self.assertIn(("", ""), batches)
+        self.assertEqual(batches[-1], ("done\n", ""))
+
+    def test_flushes_are_bounded(self):
+        process = subprocess.Popen([sys.executable, "-u", "-c",
+                                    "import time\nfor i in range(50):\n    print(i)\n    time.sleep(0.01)"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        batches, times = [], []
+        for batch in iter_process_output(process, 0.2, 5.0):
+            batches.append(batch)
+            times.append(time.monotonic())
+        process.wait()
+        # a slow machine can only spread flushes further apart, never bring them closer
+        for previous, current in zip(times[:-2], times[1:-1]):
+            self.assertGreaterEqual(current - previous, 0.19)
+        self.assertEqual("".join(b[0] for b in batches), "".join(f"{i}\n" for i in range(50)))
+
+
+class JobLogsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="logs", password="logs")
+        self.job = ConsurfJob.objects.create(user=self.user, session_id="session", log_data="line 1\nline 2\n",
+                                             error_data="warning\n")
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def write_logs(self):
+        job_path = os.path.join(self.media.name, "consurf_jobs", str(self.job.id))
+        os.makedirs(job_path)
+        with job_logs.JobLogSink(job_path, tail_size=8) as sink:
+            first = sink.append({"stdout": "é 1\n", "stderr": "warning\n"})
+            second = sink.append({"stdout": "line 2\nline 3\n"})
+        return sink, first, second
+
+    def test_sink_offsets_and_tail(self):
+        sink, first, second = self.write_logs()
+        self.assertEqual(first["stdout"], {"offset": 0, "end": 5, "data": "é 1\n"})
+        self.assertEqual(second["stdout"], {"offset": 5, "end": 19, "data": "line 2\nline 3\n"})
+        self.assertEqual(second["stderr"], {"offset": 8, "end": 8, "data": ""})
+        self.assertEqual(sink.tail("stdout"), "\nline 3\n")
+        with open(job_logs.job_log_path(self.job.id, "stdout"), "rb") as f:
+            self.assertEqual(f.read().decode(), "é 1\nline 2\nline 3\n")
+
+    def test_log_tail_ring_buffer(self):
+        tail = job_logs.LogTail(5)
+        for text in ["abc", "defg", "h", "ijklmnop"]:
+            tail.append(text)
+        self.assertEqual(tail.text(), "lmnop")
+        self.assertLessEqual(len(tail.chunks), 1)
+
+    def test_tail_lines(self):
+        content = b"".join(b"line %d\n" % i for i in range(100))
+        f = io.BytesIO(content)
+        self.assertEqual(job_logs.tail_lines(f, len(content), 2, block_size=7), b"line 98\nline 99\n")
+        self.assertEqual(job_logs.tail_lines(f, len(content), 500), content)
+        self.assertEqual(job_logs.tail_lines(io.BytesIO(b"a\nb"), 3, 1), b"b")
+
+    def test_snapshot_from_offset(self):
+        self.write_logs()
+        message = job_logs.snapshot_message(self.job, {"stdout": 5, "stderr": "x"}, limit=7)
+        self.assertEqual(message["streams"]["stdout"], {"offset": 5, "end": 12, "size": 19, "data": "line 2\n"})
+        self.assertEqual(message["streams"]["stderr"], {"offset": 0, "end": 7, "size": 8, "data": "warning"})
+
+    def test_snapshot_ends_on_character_boundaries(self):
+        self.job.log_data = "aé"
+        stdout = job_logs.snapshot_message(self.job, {}, limit=2)["streams"]["stdout"]
+        self.assertEqual(stdout, {"offset": 0, "end": 1, "size": 3, "data": "a"})
+        self.write_logs()
+        stdout = job_logs.snapshot_message(self.job, {"stdout": 1}, limit=4)["streams"]["stdout"]
+        self.assertEqual(stdout, {"offset": 0, "end": 4, "size": 19, "data": "é 1"})
+        stdout = job_logs.snapshot_message(self.job, {"stdout": 0}, limit=1)["streams"]["stdout"]
+        self.assertEqual((stdout["end"], stdout["data"]), (2, "é"))
+        stdout = job_logs.snapshot_message(self.job, {"stdout": 2}, limit=1)["streams"]["stdout"]
+        self.assertEqual((stdout["end"], stdout["data"]), (3, " "))
+
+    def test_snapshot_of_job_without_log_files(self):
+        message = job_logs.snapshot_message(self.job, {"stdout": 7}, limit=1024)
+        self.assertEqual(message["streams"]["stdout"], {"offset": 7, "end": 14, "size": 14, "data": "line 2\n"})
+
+    def test_status_message_carries_log_sizes_only(self):
+        self.write_logs()
+        with mock.patch.object(job_events, "send") as send:
+            tasks._send_job_ws(None, "session", self.job, "done")
+        message = send.call_args.args[2]
+        self.assertNotIn("log_data", message)
+        self.assertNotIn("error_data", message)
+        self.assertEqual((message["log_length"], message["error_length"], message["message"]), (19, 8, "done"))
+
+    def test_resync_access(self):
+        other = User.objects.create_user(username="other", password="other")
+        self.assertEqual(job_logs.job_for_resync(self.job.id, other, "session"), self.job)
+        self.assertEqual(job_logs.job_for_resync(str(self.job.id), self.user, "elsewhere"), self.job)
+        self.assertIsNone(job_logs.job_for_resync(self.job.id, other, "elsewhere"))
+        self.assertIsNone(job_logs.job_for_resync("abc", self.user, "session"))
+
+    def test_log_file_endpoint(self):
+        self.write_logs()
+        client = Client()
+        client.force_login(self.user)
+        url = f"/api/job/{self.job.id}/log_file/"
+        response = client.get(url, {"lines": 1})
+        self.assertEqual(response.content, b"line 3\n")
+        response = client.get(url, headers={"Range": "bytes=5-10"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"line 2")
+        response = client.get(url, {"stream": "stderr"})
+        self.assertEqual(b"".join(response.streaming_content), b"warning\n")
+        self.assertEqual(client.get(url, {"stream": "other"}).status_code, 400)
+
+    def test_ranged_responses_are_not_gzipped(self):
+        self.write_logs()
+        job_path = os.path.join(self.media.name, "consurf_jobs", str(self.job.id))
+        with zipfile.ZipFile(os.path.join(job_path, "Consurf_Outputs.zip"), "w") as archive:
+            archive.writestr("model.pdb", "ATOM 0123456789" * 100, compress_type=zipfile.ZIP_STORED)
+        client = Client()
+        client.force_login(self.user)
+        for url, params, expected in ((f"/api/job/{self.job.id}/log_file/", {}, b"line 2"),
+                                      (f"/api/job/{self.job.id}/zip_members/", {"name": "model.pdb"}, b"012345")):
+            response = client.get(url, params, headers={"Range": "bytes=5-10", "Accept-Encoding": "gzip"})
+            self.assertEqual(response.status_code, 206)
+            self.assertNotEqual(response.get("Content-Encoding"), "gzip")
+            self.assertEqual(b"".join(response.streaming_content), expected)
+
+
+class InMemoryStreams:
+    """The part of the redis client used by job_events, for tests without a redis server."""
+    def __init__(self):
+        self.streams = {}
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, key, fields, maxlen=None, approximate=True):
+        entries = self.streams.setdefault(key, [])
+        event_id = f"{len(entries) + 1}-0"
+        entries.append((event_id.encode(), {k.encode(): v.encode() for k, v in fields.items()}))
+        del entries[:-maxlen]
+        self.commands.append(event_id.encode())
+
+    def expire(self, key, seconds):
+        self.commands.append(True)
+
+    def execute(self):
+        results, self.commands = self.commands, []
+        return results
+
+    def xrange(self, key, min="-", max="+"):
+        start = (0, 0) if min == "-" else job_events.event_key(min)
+        return [entry for entry in self.streams.get(key, []) if job_events.event_key(entry[0].decode()) >= start]
+
+
+@override_settings(CONSURF_JOB_EVENTS_MAXLEN=3)
+class JobEventsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.streams = InMemoryStreams()
+        patcher = mock.patch.object(job_events, "_connection", return_value=self.streams)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replay_after_last_event(self):
+        ids = [job_events.publish(1, {"job_id": 1, "n": n}) for n in range(3)]
+        events, gap = job_events.replay(1, ids[0])
+        self.assertEqual([e["n"] for e in events], [1, 2])
+        self.assertEqual(events[-1]["event_id"], ids[2])
+        self.assertFalse(gap)
+        self.assertEqual(len(job_events.replay(1)[0]), 3)
+
+    def test_trimmed_stream_is_a_gap(self):
+        ids = [job_events.publish(1, {"job_id": 1, "n": n}) for n in range(5)]
+        events, gap = job_events.replay(1, ids[0])
+        self.assertEqual([e["n"] for e in events], [2, 3, 4])
+        self.assertTrue(gap)
+        with self.assertRaises(ValueError):
+            job_events.replay(1, "latest")
+
+    def test_trimmed_log_deltas_are_a_gap_without_last_event(self):
+        for start in range(0, 8, 2):
+            job_events.publish(1, {"job_id": 1, "type": "log_delta", "streams": {
+                "stdout": {"offset": start, "end": start + 2, "data": "a\n"}}})
+        events, gap = job_events.replay(1)
+        self.assertEqual([e["streams"]["stdout"]["offset"] for e in events], [2, 4, 6])
+        self.assertTrue(gap)
+        self.streams.streams.clear()
+        job_events.publish(1, {"job_id": 1, "status": "running"})
+        job_events.publish(1, {"job_id": 1, "type": "log_delta", "streams": {
+            "stdout": {"offset": 0, "end": 2, "data": "a\n"}, "stderr": {"offset": 0, "end": 0, "data": ""}}})
+        self.assertFalse(job_events.replay(1)[1])
+
+    def test_send_stores_messages_with_a_job(self):
+        channel = mock.Mock(group_send=mock.AsyncMock())
+        job_events.send(channel, "session", {"job_id": 1, "status": "running"})
+        job_events.send(channel, "session", {"job_id": 1, "status": "running"}, store=False)
+        job_events.send(channel, "session", {"type": "notification"})
+        sent = [c.args[1]["message"] for c in channel.group_send.call_args_list]
+        self.assertEqual(sent[0]["event_id"], "1-0")
+        self.assertNotIn("event_id", sent[1])
+        self.assertEqual(len(job_events.replay(1)[0]), 1)
+
+
+class MessageCoalescerTestCase(SimpleTestCase):
+    def delta(self, start, data, event_id):
+        return {"type": "log_delta", "job_id": 1, "status": "running", "event_id": event_id,
+                "streams": {"stdout": {"offset": start, "end": start + len(data), "data": data},
+                            "stderr": {"offset": 0, "end": 0, "data": ""}}}
+
+    def test_merges_contiguous_deltas(self):
+        coalescer = job_events.MessageCoalescer()
+        first = self.delta(0, "a\n", "1-0")
+        coalescer.add(first)
+        coalescer.add(self.delta(2, "b\n", "2-0"))
+        coalescer.add(self.delta(10, "c\n", "3-0"))
+        pending = coalescer.drain()
+        self.assertEqual(len(pending), 2)
+        self.assertEqual(pending[0]["streams"]["stdout"], {"offset": 0, "end": 4, "data": "a\nb\n"})
+        self.assertEqual(pending[0]["event_id"], "2-0")
+        self.assertEqual(first["streams"]["stdout"]["data"], "a\n")
+        self.assertEqual(len(coalescer), 0)
+
+    def test_keeps_latest_status(self):
+        coalescer = job_events.MessageCoalescer()
+        coalescer.add({"job_id": 1, "status": "running", "message": "Job started"})
+        coalescer.add(self.delta(0, "a\n", "1-0"))
+        coalescer.add({"job_id": 2, "status": "running"})
+        coalescer.add({"job_id": 1, "status": "completed"})
+        coalescer.add("client text")
+        self.assertEqual([m if isinstance(m, str) else m.get("status") for m in coalescer.drain()],
+                         ["running", "running", "completed", "client text"])
+
+    def test_event_ids_do_not_go_backwards(self):
+        coalescer = job_events.MessageCoalescer()
+        coalescer.add(self.delta(0, "a\n", "1-0"))
+        coalescer.add({"job_id": 1, "status": "running", "event_id": "2-0"})
+        coalescer.add(self.delta(2, "b\n", "3-0"))
+        pending = coalescer.drain()
+        self.assertEqual([m["event_id"] for m in pending], ["2-0", "3-0"])
+        self.assertEqual(pending[1]["streams"]["stdout"]["data"], "a\nb\n")
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_counters_are_shared(self):
+        before = job_events.stats()
+        job_events.count("broadcasts", 2)
+        self.assertEqual(job_events.stats()["broadcasts"], before["broadcasts"] + 2)
+        self.assertEqual(cache.get("consurf_ws_stats:broadcasts"), before["broadcasts"] + 2)
+
+    def test_rate_limiter(self):
+        limiter = job_events.RateLimiter(rate=0.001, burst=3)
+        self.assertEqual([limiter.allow() for _ in range(5)], [True, True, True, False, False])
+
+
+class WebsocketAuthTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="socket", password="socket")
+        self.token = Token.objects.get(user=self.user)
+
+    def get_user(self, credential):
+        return async_to_sync(authentication.get_user)(credential)
+
+    def test_token_user_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_user(self.token.key), self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_user(self.token.key), self.user)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("authtoken", queries[0]["sql"])
+
+    def test_deleted_token_is_forgotten(self):
+        self.get_user(self.token.key)
+        self.token.delete()
+        self.assertFalse(self.get_user(self.token.key).is_authenticated)
+
+    def test_session_key(self):
+        client = Client()
+        client.force_login(self.user)
+        session_key = client.session.session_key
+        self.assertEqual(self.get_user(session_key), self.user)
+        client.logout()
+        self.assertFalse(self.get_user(session_key).is_authenticated)
+
+    def test_expired_session(self):
+        client = Client()
+        client.force_login(self.user)
+        Session.objects.filter(session_key=client.session.session_key).update(expire_date=timezone.now())
+        self.assertFalse(self.get_user(client.session.session_key).is_authenticated)
+
+    def test_query_param(self):
+        self.assertEqual(authentication._query_param(b"a=1&token=abc&b=2", b"token"), "abc")
+        self.assertEqual(authentication._query_param(b"mytoken=x&token=", b"token"), "")
+        self.assertEqual(authentication._query_param(b"flag&token=abc", b"token"), "abc")
+        self.assertIsNone(authentication._query_param(b"mytoken=x", b"token"))
+
+
+class JobResultReuseTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+        self.user = User.objects.create_user(username="reuser", password="reuser")
+        self.client.force_login(self.user)
+        self.database = ProteinFastaDatabase(name="db", user=self.user)
+        self.database.fasta_file.save("db.fasta", ContentFile(b">a\nMKV\n"))
+        self.submission = {"job_title": "again", "query_sequence": ">q\nMKVL\n", "fasta_database_id": self.database.id,
+                           "cutoff": 0.001}
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def job(self, **fields):
+        # the defaults of ConsurfJobViewSet.create
+        return ConsurfJob(**{"user": self.user, "query_sequence": ">q\nMKVL\n", "fasta_database": self.database,
+                             "cutoff": 0.001, "alignment_program": "MAFFT", **fields})
+
+    def test_result_key(self):
+        key = job_results.result_key(self.job())
+        self.assertEqual(job_results.result_key(self.job(query_sequence=" >q\r\nMKVL  \n\n")), key)
+        self.assertNotEqual(job_results.result_key(self.job(max_homologs=10)), key)
+        with open(self.database.fasta_file.path, "ab") as f:
+            f.write(b">b\nMKL\n")
+        os.utime(self.database.fasta_file.path, ns=(0, 0))
+        self.assertNotEqual(job_results.result_key(self.job()), key)
+
+    def completed_job(self, **fields):
+        source = self.job(status="completed", log_data="done", job_title="first", **fields)
+        source.result_key = job_results.result_key(source)
+        source.save()
+        os.makedirs(job_results.job_path(source.id))
+        with zipfile.ZipFile(os.path.join(job_results.job_path(source.id), "Consurf_Outputs.zip"), "w") as archive:
+            archive.writestr("log.txt", "done")
+        return source
+
+    def submit_and_run(self, submission):
+        with mock.patch("ct.views.run_consurf_job") as run:
+            run.delay.return_value.id = "rq"
+            body = self.client.post("/api/job/", submission, content_type="application/json").json()
+        self.assertEqual(body["status"], "pending")
+        args = run.delay.call_args.args
+        with mock.patch.object(job_events, "send"), mock.patch("ct.tasks.subprocess.Popen") as popen:
+            popen.side_effect = OSError("not run in tests")
+            try:
+                tasks.run_consurf_job(*args)
+            except OSError:
+                pass
+        return ConsurfJob.objects.get(id=body["id"]), args
+
+    def test_identical_submission_reuses_outputs(self):
+        source = self.completed_job()
+        consurf_job, args = self.submit_and_run(self.submission)
+        self.assertTrue(args[2])
+        self.assertEqual((consurf_job.status, consurf_job.log_data, consurf_job.result_key),
+                         ("completed", "done", source.result_key))
+        outputs = os.path.join(job_results.job_path(consurf_job.id), "Consurf_Outputs.zip")
+        self.assertEqual(os.stat(outputs).st_ino, os.stat(os.path.join(job_results.job_path(source.id),
+                                                                        "Consurf_Outputs.zip")).st_ino)
+
+    def test_job_completed_before_the_view_returns_stays_completed(self):
+        source = self.completed_job()
+
+        def run_now(*args):
+            with mock.patch.object(job_events, "send"):
+                tasks.run_consurf_job(*args)
+            return mock.Mock(id="rq")
+
+        with mock.patch("ct.views.run_consurf_job") as run:
+            run.delay.side_effect = run_now
+            body = self.client.post("/api/job/", self.submission, content_type="application/json").json()
+        consurf_job = ConsurfJob.objects.get(id=body["id"])
+        self.assertEqual((consurf_job.status, consurf_job.log_data, consurf_job.result_key, consurf_job.rq_job_id),
+                         ("completed", "done", source.result_key, "rq"))
+
+    def test_jobs_of_other_users_are_not_reused(self):
+        self.completed_job(user=User.objects.create_user(username="stranger"))
+        consurf_job, _ = self.submit_and_run(self.submission)
+        self.assertNotEqual(consurf_job.status, "completed")
+        self.assertIsNotNone(consurf_job.result_key)
+
+    def test_reuse_can_be_turned_off(self):
+        self.completed_job()
+        consurf_job, args = self.submit_and_run({**self.submission, "reuse": "false"})
+        self.assertFalse(args[2])
+        self.assertNotEqual(consurf_job.status, "completed")
+
+    def test_changed_submission_runs(self):
+        with mock.patch("ct.views.run_consurf_job") as run:
+            run.delay.return_value.id = "rq"
+            body = self.client.post("/api/job/", {**self.submission, "cutoff": 0.01},
+                                    content_type="application/json").json()
+        run.delay.assert_called_once()
+        self.assertEqual(body["status"], "pending")
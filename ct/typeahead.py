@@ -0,0 +1,69 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# bumped in the shared cache whenever CONSURFModel rows change, so every process knows to rebuild its index
+VERSION_KEY = "consurf_typeahead:version"
+
+_lock = threading.Lock()
+_state = {"accessions": None, "version": None, "checked_at": 0.0}
+
+
+def _shared_version():
+    try:
+        return cache.get(VERSION_KEY)
+    except Exception:
+        return None
+
+
+def _build() -> list[str]:
+    from ct.models import CONSURFModel
+    return sorted(
+        CONSURFModel.objects.exclude(uniprot_accession__isnull=True).exclude(uniprot_accession="")
+        .values_list("uniprot_accession", flat=True)
+    )
+
+
+def _index() -> list[str]:
+    now = time.monotonic()
+    with _lock:
+        accessions = _state["accessions"]
+        if accessions is not None and now - _state["checked_at"] < settings.CONSURF_TYPEAHEAD_CHECK_INTERVAL:
+            return accessions
+    version = _shared_version()
+    with _lock:
+        if _state["accessions"] is not None and version == _state["version"]:
+            _state["checked_at"] = now
+            return _state["accessions"]
+    accessions = _build()
+    with _lock:
+        _state.update(accessions=accessions, version=version, checked_at=now)
+    return accessions
+
+
+def search(prefix: str, limit: int = 10) -> list[str]:
+    """
+    Return the first accessions in sorted order that start with prefix, from a sorted in-process list of every
+    accession that is built on first use and rebuilt after CONSURFModel rows change.
+    """
+    accessions = _index()
+    start = bisect.bisect_left(accessions, prefix)
+    results = []
+    for accession in accessions[start:start + limit]:
+        if not accession.startswith(prefix):
+            break
+        results.append(accession)
+    return results
+
+
+def invalidate():
+    """Drop the index of this process and tell the other processes to drop theirs."""
+    with _lock:
+        _state["accessions"] = None
+    try:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    except Exception:
+        pass
@@ -1,12 +1,188 @@
+import contextlib
+import functools
+import importlib.util
+import io
 import re
+import struct
+import numpy as np
 import pandas as pd
 import zipfile
 import os
-import tempfile
+
+from django.conf import settings
+
+STANDALONE_GRADE_COLUMNS = [
+    'POS', 'SEQ', 'ATOM', 'SCORE', 'COLOR', 'CONFIDENCE_INTERVAL', 'CONFIDENCE_INTERVAL_COLORS',
+    'B/E', 'FUNCTION', 'MSA_DATA', 'RESIDUE_VARIETY'
+]
+STANDALONE_GRADE_PATTERNS = {
+    'POS': r'\d+',
+    'SEQ': r'[A-Z]',
+    'ATOM': r'[A-Z]{3}\d+[A-Z]?',
+    'SCORE': r'-?\d+\.\d{1,3}',
+    'COLOR': r'\d',
+    'CONFIDENCE_INTERVAL': r'-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3}',
+    'CONFIDENCE_INTERVAL_COLORS': r'\d,\d',
+    'B/E': r'[be]',
+    'FUNCTION': r'[fs]',
+    'MSA_DATA': r'\d+/\d+',
+    'RESIDUE_VARIETY': r'[A-Z](, [A-Z])*'
+}
+
+WEBSERVER_GRADE_COLUMNS = [
+    'POS', 'SEQ', 'SCORE', 'COLOR', 'CONFIDENCE_INTERVAL',
+    'CONFIDENCE_INTERVAL_COLORS', 'MSA_DATA', 'RESIDUE_VARIETY', 'B/E', 'FUNCTION'
+]
+WEBSERVER_GRADE_PATTERNS = {
+    'POS': r'\d+',
+    'SEQ': r'[A-Z]',
+    'SCORE': r'-?\d+\.\d{1,3}',
+    'COLOR': r'\w\**',
+    'CONFIDENCE_INTERVAL': r'-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3}',
+    'CONFIDENCE_INTERVAL_COLORS': r'\d,\d',
+    'B/E': r'[be]',
+    'FUNCTION': r'[fs]',
+    'MSA_DATA': r'\d+/\d+',
+    'RESIDUE_VARIETY': r'[A-Z](, [A-Z])*'
+}
+
+# Columns whose legacy regex search does not move the cursor forward: they are all looked up
+# from the end of the last positional column.
+_GRADE_NON_ADVANCING_COLUMNS = ("FUNCTION", "B/E", "RESIDUE_VARIETY", "MSA_DATA")
+
+GRADE_PARSER_ENGINES = ("vectorized", "legacy")
+
+_ZIP_LOCAL_HEADER = "<4s5H3L2H"
+
+
+def _grade_group_name(column: str) -> str:
+    return "BE" if column == "B/E" else column
+
+
+def _compile_grade_row_pattern(column_names: list[str], patterns: dict[str, str]) -> re.Pattern:
+    """
+    Fold the per-column searches of the legacy parser into one anchored row regex.
+
+    Every positional column becomes an optional lazy group, so a column that cannot be found is
+    left as None without moving the cursor, just like the legacy ``search`` loop. Non-advancing
+    columns are wrapped in a lookahead so they are searched from the same cursor position.
+    Because every part is optional the first path tried always succeeds, which keeps the
+    leftmost-match semantics of the column-by-column search.
+    """
+    parts = []
+    for column in column_names:
+        part = f"(?:.*?(?P<{_grade_group_name(column)}>{patterns[column]}))?"
+        if column in _GRADE_NON_ADVANCING_COLUMNS:
+            part = f"(?={part})"
+        parts.append(part)
+    return re.compile("".join(parts), re.DOTALL)
+
+
+_STANDALONE_GRADE_ROW = _compile_grade_row_pattern(STANDALONE_GRADE_COLUMNS, STANDALONE_GRADE_PATTERNS)
+_WEBSERVER_GRADE_ROW = _compile_grade_row_pattern(WEBSERVER_GRADE_COLUMNS, WEBSERVER_GRADE_PATTERNS)
+
+# Strict whitespace separated layouts of well-formed rows. They avoid the lazy scanning of the row patterns
+# above and capture the same tokens, any row they reject goes through the row pattern instead.
+_STANDALONE_GRADE_LINE = re.compile(
+    r"[ \t]*(?P<POS>\d+)\s+(?P<SEQ>[A-Z])\s+(?:(?P<ATOM>[A-Z]{3}\d+[A-Z]?):[A-Z0-9]|-)"
+    r"\s+(?P<SCORE>-?\d+\.\d{1,3})\s+(?P<COLOR>\d)\*?"
+    r"\s+(?P<CONFIDENCE_INTERVAL>-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3})\s+(?P<CONFIDENCE_INTERVAL_COLORS>\d,\d)"
+    r"\s+(?:(?P<BE>[be])\s+)?(?:(?P<FUNCTION>[fs])\s+)?(?P<MSA_DATA>\d+/\d+)"
+    r"\s+(?P<RESIDUE_VARIETY>[A-Z](?:, [A-Z])*)\s*$"
+)
+_WEBSERVER_GRADE_LINE = re.compile(
+    r"[ \t]*(?P<POS>\d+)\s+(?P<SEQ>[A-Z])\s+(?P<SCORE>-?\d+\.\d{1,3})\s+(?P<COLOR>\w\**)"
+    r"\s+(?P<CONFIDENCE_INTERVAL>-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3})\s+(?P<CONFIDENCE_INTERVAL_COLORS>\d,\d)"
+    r"\s+(?P<MSA_DATA>\d+/\d+)\s+(?P<RESIDUE_VARIETY>[A-Z](?:, [A-Z])*)"
+    r"(?:\s+(?P<BE>[be]))?(?:\s+(?P<FUNCTION>[fs]))?\s*$"
+)
+
+def zip_member_data_offset(fileobj, header_offset: int) -> int:
+    """Return where the data of the zip member whose local header starts at header_offset begins."""
+    fileobj.seek(header_offset)
+    header = struct.unpack(_ZIP_LOCAL_HEADER, fileobj.read(struct.calcsize(_ZIP_LOCAL_HEADER)))
+    if header[0] != b"PK\x03\x04":
+        raise zipfile.BadZipFile("Bad magic number for file header")
+    # the local header can carry a different extra field than the central directory
+    return header_offset + struct.calcsize(_ZIP_LOCAL_HEADER) + header[-2] + header[-1]
+
+
+@functools.lru_cache(maxsize=64)
+def _zip_directory(zip_path: str, size: int, mtime_ns: int) -> dict[str, zipfile.ZipInfo]:
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return {info.filename: info for info in zip_ref.infolist()}
+
+
+def zip_directory(zip_path) -> dict[str, zipfile.ZipInfo]:
+    """
+    Return the central directory of a zip archive as a dict of member name to ZipInfo. It is cached per
+    archive path, size and mtime, so repeated lookups into the same archive do not scan it again.
+    """
+    stat = os.stat(zip_path)
+    return _zip_directory(os.path.abspath(zip_path), stat.st_size, stat.st_mtime_ns)
+
+
+def open_zip_member(zip_path, member_name: str) -> zipfile.ZipExtFile:
+    """
+    Open a member of a zip archive for reading. The member is found in the cached central directory and read
+    from its local header on, so the directory of the archive is not parsed again for every member opened.
+    """
+    info = zip_directory(zip_path).get(member_name)
+    if info is None:
+        raise FileNotFoundError(f"{member_name} not found in {zip_path}")
+    if info.flag_bits & 0x1:
+        raise zipfile.BadZipFile(f"{member_name} in {zip_path} is encrypted")
+    f = open(zip_path, "rb")
+    try:
+        f.seek(zip_member_data_offset(f, info.header_offset))
+        # the file is closed together with the member
+        return zipfile.ZipExtFile(f, "r", info, None, True)
+    except Exception:
+        f.close()
+        raise
+
+
+def iter_stored_zip_member(zip_path, member_name: str, start: int = 0, end: int | None = None,
+                           chunk_size: int = 64 * 1024):
+    """
+    Yield bytes start to end (inclusive) of a member that is stored without compression, reading them straight
+    from the archive so that only the requested range is touched.
+    """
+    info = zip_directory(zip_path).get(member_name)
+    if info is None:
+        raise FileNotFoundError(f"{member_name} not found in {zip_path}")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{member_name} is compressed and cannot be read by range")
+    if end is None or end >= info.file_size:
+        end = info.file_size - 1
+    with open(zip_path, "rb") as f:
+        f.seek(zip_member_data_offset(f, info.header_offset) + start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def find_consurf_grade_member(zip_path) -> str:
+    for name in zip_directory(zip_path):
+        if name.endswith('_consurf_grades.txt') or name == 'no_model_consurf_grades.txt':
+            return name
+    raise FileNotFoundError("No consurf grades file found in the zip archive")
+
+
+def find_consurf_msa_variation_member(zip_path) -> str:
+    for name in zip_directory(zip_path):
+        if name.endswith('msa_aa_variety_percentage.csv'):
+            return name
+    raise FileNotFoundError("No msa_aa_variety_percentage.csv found in the zip archive")
+
 
 def read_consurf_grade_from_zip(zip_path, grade_filename=None):
     """
-    Extract and read consurf_grades.txt file from a zip archive
+    Read consurf_grades.txt file from a zip archive without extracting it
 
     Parameters:
     zip_path (str): Path to the zip file
@@ -16,66 +192,50 @@ def read_consurf_grade_from_zip(zip_path, grade_filename=None):
     Returns:
     pd.DataFrame: DataFrame containing the parsed consurf grades
     """
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        # Find the consurf grades file
-        if grade_filename is None:
-            # Look for any file ending with _consurf_grades.txt
-            for file in zip_ref.namelist():
-                if file.endswith('_consurf_grades.txt') or file == 'no_model_consurf_grades.txt':
-                    grade_filename = file
-                    break
+    if grade_filename is None:
+        grade_filename = find_consurf_grade_member(zip_path)
+    with open_zip_member(zip_path, grade_filename) as member:
+        return read_consurf_grade_file_new(member)
 
-            if grade_filename is None:
-                raise FileNotFoundError("No consurf grades file found in the zip archive")
 
-        # Create a temporary file to extract to
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_path = temp_file.name
+def read_consurf_msa_variation_from_zip(zip_path, member_name=None):
+    """Read msa_aa_variety_percentage.csv from a zip archive without extracting it"""
+    if member_name is None:
+        member_name = find_consurf_msa_variation_member(zip_path)
+    with open_zip_member(zip_path, member_name) as member:
+        return read_consurf_msa_variation_file(member)
 
-        # Extract the file to the temporary location
-        zip_ref.extract(grade_filename, path=os.path.dirname(temp_path))
-        extracted_path = os.path.join(os.path.dirname(temp_path), grade_filename)
 
+@contextlib.contextmanager
+def _open_text(source):
+    """Yield a text stream over a file path, raw bytes or an open text or binary file-like object."""
+    if isinstance(source, (bytes, bytearray)):
+        yield io.StringIO(bytes(source).decode(), newline=None)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rt") as f:
+            yield f
+    elif isinstance(source, io.TextIOBase):
+        yield source
+    else:
+        wrapper = io.TextIOWrapper(source, encoding="utf-8")
         try:
-            # Read the extracted file
-            df = read_consurf_grade_file_new(extracted_path)
-            return df
+            yield wrapper
         finally:
-            # Clean up the temporary file
-            if os.path.exists(extracted_path):
-                os.remove(extracted_path)
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-def read_consurf_grade_file_new(file_path: str) -> pd.DataFrame:
-    column_names = [
-        'POS', 'SEQ', 'ATOM', 'SCORE', 'COLOR', 'CONFIDENCE_INTERVAL', 'CONFIDENCE_INTERVAL_COLORS',
-        'B/E', 'FUNCTION', 'MSA_DATA', 'RESIDUE_VARIETY'
-    ]
-    patterns = {
-        'POS': r'\d+',
-        'SEQ': r'[A-Z]',
-        'ATOM': r'[A-Z]{3}\d+[A-Z]?',
-        'SCORE': r'-?\d+\.\d{1,3}',
-        'COLOR': r'\d',
-        'CONFIDENCE_INTERVAL': r'-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3}',
-        'CONFIDENCE_INTERVAL_COLORS': r'\d,\d',
-        'B/E': r'[be]',
-        'FUNCTION': r'[fs]',
-        'MSA_DATA': r'\d+/\d+',
-        'RESIDUE_VARIETY': r'[A-Z](, [A-Z])*'
-    }
+            wrapper.detach()
 
+def _read_consurf_grade_file_new_legacy(file_path) -> pd.DataFrame:
+    column_names = STANDALONE_GRADE_COLUMNS
+    patterns = STANDALONE_GRADE_PATTERNS
     compiled_patterns = {col: re.compile(pat) for col, pat in patterns.items()}
     started = False
-    with open(file_path, "rt") as f:
+    with _open_text(file_path) as f:
         data = []
         for line in f:
             row = {}
             if line.startswith("*") or line.startswith("or"):
                 continue
             if not started:
-                if "SCORE" in line and "COLOR" in line and "CONFIDENCE INTERVAL" in line:
+                if _is_standalone_grade_header(line):
                     started = True
             else:
                 if line.strip() == "":
@@ -86,7 +246,7 @@ def read_consurf_grade_file_new(file_path: str) -> pd.DataFrame:
                 for currentColumn in column_names:
                     match = compiled_patterns[currentColumn].search(line[start_position:])
                     if match:
-                        if currentColumn not in ("FUNCTION", "B/E", "RESIDUE_VARIETY", "MSA_DATA"):
+                        if currentColumn not in _GRADE_NON_ADVANCING_COLUMNS:
                             start_position += match.end()
                         if currentColumn == "POS":
                             row[currentColumn] = int(match.group(0))
@@ -120,38 +280,19 @@ def read_consurf_grade_file_new(file_path: str) -> pd.DataFrame:
         raise ValueError("No data found in file")
     return pd.DataFrame(data)
 
-def read_consurf_grade_file(file_path: str) -> pd.DataFrame:
-    """
-    Read consurf_grade file from consurf web server and return a pandas dataframe
-    :param file_path: path to the consurf_grade file
-    :return: pandas dataframe
-    """
-    column_names = [
-        'POS', 'SEQ', 'SCORE', 'COLOR', 'CONFIDENCE_INTERVAL',
-        'CONFIDENCE_INTERVAL_COLORS', 'MSA_DATA', 'RESIDUE_VARIETY', 'B/E', 'FUNCTION'
-    ]
-    patterns = {
-        'POS': r'\d+',
-        'SEQ': r'[A-Z]',
-        'SCORE': r'-?\d+\.\d{1,3}',
-        'COLOR': r'\w\**',
-        'CONFIDENCE_INTERVAL': r'-?\d+\.\d{1,3},\s+-?\d+\.\d{1,3}',
-        'CONFIDENCE_INTERVAL_COLORS': r'\d,\d',
-        'B/E': r'[be]',
-        'FUNCTION': r'[fs]',
-        'MSA_DATA': r'\d+/\d+',
-        'RESIDUE_VARIETY': r'[A-Z](, [A-Z])*'
-    }
+def _read_consurf_grade_file_legacy(file_path) -> pd.DataFrame:
+    column_names = WEBSERVER_GRADE_COLUMNS
+    patterns = WEBSERVER_GRADE_PATTERNS
     compiled_patterns = {col: re.compile(pat) for col, pat in patterns.items()}
     started = False
-    with open(file_path, "rt") as f:
+    with _open_text(file_path) as f:
         data = []
         for line in f:
             row = {}
             if line.startswith("*") or line.startswith("or"):
                 continue
             if not started:
-                if all([i.replace("_", " ") in line for i in column_names]):
+                if _is_webserver_grade_header(line):
                     started = True
             else:
                 if line.strip() == "":
@@ -163,7 +304,7 @@ def read_consurf_grade_file(file_path: str) -> pd.DataFrame:
                     match = compiled_patterns[currentColumn].search(line[start_position:])
 
                     if match:
-                        if currentColumn not in ("FUNCTION", "B/E", "RESIDUE_VARIETY", "MSA_DATA"):
+                        if currentColumn not in _GRADE_NON_ADVANCING_COLUMNS:
                             start_position += match.end()
                         if currentColumn == "POS":
                             row[currentColumn] = int(match.group(0))
@@ -198,18 +339,205 @@ def read_consurf_grade_file(file_path: str) -> pd.DataFrame:
     return pd.DataFrame(data)
 
 
-def read_consurf_msa_variation_file(file_path: str) -> pd.DataFrame:
-    column_names = [
-        "pos", "A", "C", "D", "E", "F", "G", "H", "I", "K", "L", "M", "N", "P", "Q", "R", "S", "T", "V", "W", "Y", "OTHER", "MAX AA", "ConSurf Grade"
-        ]
-    df = pd.read_csv(file_path, skiprows=5, names=column_names)
-    for c in column_names:
+def _grade_ints(values):
+    return np.array(values, dtype=np.int64)
+
+
+def _grade_floats(values):
+    return np.array(values, dtype=np.float64)
+
+
+def _grade_strings(values):
+    return list(values)
+
+
+def _grade_color_list(values):
+    return [[v] for v in _grade_ints(values).tolist()]
+
+
+def _grade_float_pairs(values):
+    pairs = np.array(",".join(values).split(","), dtype=np.float64).reshape(-1, 2)
+    return list(zip(pairs[:, 0].tolist(), pairs[:, 1].tolist()))
+
+
+def _grade_string_pairs(values):
+    flat = iter(",".join(values).split(","))
+    return list(zip(flat, flat))
+
+
+def _grade_msa_data(values):
+    return np.array("/".join(values).split("/"), dtype=np.int64).reshape(-1, 2).tolist()
+
+
+def _grade_residue_variety(values):
+    return [v.split(", ") for v in values]
+
+
+_GRADE_CONVERTERS = {
+    "POS": _grade_ints,
+    "SEQ": _grade_strings,
+    "ATOM": _grade_strings,
+    "SCORE": _grade_floats,
+    "COLOR": _grade_strings,
+    "CONFIDENCE_INTERVAL": _grade_float_pairs,
+    "CONFIDENCE_INTERVAL_COLORS": _grade_string_pairs,
+    "BE": _grade_strings,
+    "FUNCTION": _grade_strings,
+    "MSA_DATA": _grade_msa_data,
+    "RESIDUE_VARIETY": _grade_residue_variety,
+}
+_STANDALONE_GRADE_CONVERTERS = dict(_GRADE_CONVERTERS, COLOR=_grade_color_list)
+
+
+def _convert_grade_column(values: tuple, convert):
+    """Convert one column of matched strings, leaving the rows where the column was not found as None."""
+    if None not in values:
+        return convert(values)
+    present = [v for v in values if v is not None]
+    converted = convert(present) if present else []
+    if isinstance(converted, np.ndarray):
+        converted = converted.tolist()
+    converted = iter(converted)
+    return [None if v is None else next(converted) for v in values]
+
+
+def _read_consurf_grade_file_vectorized(file_path, line_pattern: re.Pattern, row_pattern: re.Pattern,
+                                        is_header, converters: dict) -> pd.DataFrame:
+    """
+    Single pass parser shared by both grade formats: one regex match per residue line, then
+    every column is converted at once into NumPy arrays or lists.
+    """
+    names = list(row_pattern.groupindex)
+    rows = []
+    started = False
+    with _open_text(file_path) as f:
+        for line in f:
+            if line.startswith("*") or line.startswith("or"):
+                continue
+            if not started:
+                started = is_header(line)
+            elif line.strip() == "" or "normalized" in line:
+                continue
+            else:
+                match = line_pattern.match(line) or row_pattern.match(line)
+                rows.append(match.group(*names))
+
+    if len(rows) == 0:
+        raise ValueError("No data found in file")
+    return pd.DataFrame({
+        name: _convert_grade_column(values, converters[name]) for name, values in zip(names, zip(*rows))
+    })
+
+
+def _is_standalone_grade_header(line: str) -> bool:
+    return "SCORE" in line and "COLOR" in line and "CONFIDENCE INTERVAL" in line
+
+
+def _is_webserver_grade_header(line: str) -> bool:
+    return all([i.replace("_", " ") in line for i in WEBSERVER_GRADE_COLUMNS])
+
+
+def _grade_parser_engine(grade_format: str, engine: str | None) -> str:
+    if engine is None:
+        engine = settings.CONSURF_GRADE_PARSER_ENGINES.get(grade_format, "vectorized")
+    if engine not in GRADE_PARSER_ENGINES:
+        raise ValueError(f"Unknown grade parser engine: {engine}")
+    return engine
+
+
+def read_consurf_grade_file_new(file_path, engine: str | None = None) -> pd.DataFrame:
+    """
+    Read consurf_grades.txt produced by the stand-alone ConSurf pipeline and return a pandas dataframe
+    :param file_path: path to the consurf_grade file, its content as bytes or a file-like object
+    :param engine: "vectorized" or "legacy", defaults to CONSURF_GRADE_PARSER_ENGINES["standalone"]
+    :return: pandas dataframe
+    """
+    if _grade_parser_engine("standalone", engine) == "legacy":
+        return _read_consurf_grade_file_new_legacy(file_path)
+    return _read_consurf_grade_file_vectorized(file_path, _STANDALONE_GRADE_LINE, _STANDALONE_GRADE_ROW,
+                                               _is_standalone_grade_header, _STANDALONE_GRADE_CONVERTERS)
+
+
+def read_consurf_grade_file(file_path, engine: str | None = None) -> pd.DataFrame:
+    """
+    Read consurf_grade file from consurf web server and return a pandas dataframe
+    :param file_path: path to the consurf_grade file, its content as bytes or a file-like object
+    :param engine: "vectorized" or "legacy", defaults to CONSURF_GRADE_PARSER_ENGINES["webserver"]
+    :return: pandas dataframe
+    """
+    if _grade_parser_engine("webserver", engine) == "legacy":
+        return _read_consurf_grade_file_legacy(file_path)
+    return _read_consurf_grade_file_vectorized(file_path, _WEBSERVER_GRADE_LINE, _WEBSERVER_GRADE_ROW,
+                                               _is_webserver_grade_header, _GRADE_CONVERTERS)
+
+
+MSA_VARIATION_AMINO_ACIDS = [
+    "A", "C", "D", "E", "F", "G", "H", "I", "K", "L", "M", "N", "P", "Q", "R", "S", "T", "V", "W", "Y", "OTHER"
+]
+MSA_VARIATION_COLUMNS = ["pos"] + MSA_VARIATION_AMINO_ACIDS + ["MAX AA", "ConSurf Grade"]
+MSA_VARIATION_PARSER_ENGINES = ("typed", "pyarrow", "legacy")
+_MSA_VARIATION_PREAMBLE_LINES = 5
+_MSA_VARIATION_DTYPES = {
+    **{aa: "float32" for aa in MSA_VARIATION_AMINO_ACIDS}, "MAX AA": "category", "ConSurf Grade": str
+}
+
+
+def _read_consurf_msa_variation_file_legacy(file_path) -> pd.DataFrame:
+    df = pd.read_csv(file_path, skiprows=5, names=MSA_VARIATION_COLUMNS)
+    for c in MSA_VARIATION_COLUMNS:
         if c not in ("pos", "MAX AA", "ConSurf Grade"):
             df[c] = df[c].fillna(0)
     df["ConSurf Grade"] = df["ConSurf Grade"].astype(str)
     df.rename(columns={"ConSurf Grade": "ConSurf_Grade", "MAX AA": "MAX_AA"}, inplace=True)
     return df
 
+
+def _read_consurf_msa_variation_file_typed(file_path, engine: str) -> pd.DataFrame:
+    # the preamble is skipped by hand so that every csv engine is handed the same plain table
+    if isinstance(file_path, (str, os.PathLike)):
+        with open(file_path, "rb") as f:
+            content = f.read()
+    else:
+        content = file_path.read()
+        if isinstance(content, str):
+            content = content.encode()
+    start = 0
+    for _ in range(_MSA_VARIATION_PREAMBLE_LINES):
+        start = content.find(b"\n", start) + 1
+        if start == 0:
+            start = len(content)
+            break
+    df = pd.read_csv(io.BytesIO(content[start:]), names=MSA_VARIATION_COLUMNS, header=None,
+                     dtype=_MSA_VARIATION_DTYPES, engine=engine)
+    df.fillna(dict.fromkeys(MSA_VARIATION_AMINO_ACIDS, 0), inplace=True)
+    df["ConSurf Grade"] = df["ConSurf Grade"].astype(str)
+    df.rename(columns={"ConSurf Grade": "ConSurf_Grade", "MAX AA": "MAX_AA"}, inplace=True)
+    return df
+
+
+def _msa_variation_parser_engine(engine: str | None) -> str:
+    engine = engine or settings.CONSURF_MSA_VARIATION_PARSER_ENGINE
+    if engine not in MSA_VARIATION_PARSER_ENGINES:
+        raise ValueError(f"Unknown msa variation parser engine {engine}")
+    if engine == "pyarrow" and importlib.util.find_spec("pyarrow") is None:
+        return "typed"
+    return engine
+
+
+def read_consurf_msa_variation_file(file_path, engine: str | None = None) -> pd.DataFrame:
+    """
+    Read msa_aa_variety_percentage.csv from a path, its content as bytes or a file-like object. The typed
+    engine stores the amino acid percentages as float32 and MAX_AA as a categorical, the pyarrow engine does the
+    same with the multithreaded pyarrow csv reader when it is installed, and the legacy engine lets pandas infer
+    float64 and object columns.
+    """
+    if isinstance(file_path, (bytes, bytearray)):
+        file_path = io.BytesIO(file_path)
+    engine = _msa_variation_parser_engine(engine)
+    if engine == "legacy":
+        return _read_consurf_msa_variation_file_legacy(file_path)
+    return _read_consurf_msa_variation_file_typed(file_path, "pyarrow" if engine == "pyarrow" else "c")
+
 def get_all_pdb_chains(file_path: str) -> list[str]:
     results = []
     with open(file_path, "rt") as f:
@@ -4,7 +4,6 @@ import os
 import shutil
 import uuid
 
-from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
 import requests
@@ -14,8 +13,8 @@ from django.contrib.auth import logout
 from django.contrib.auth.models import User
 from django.core.files.base import File
 from django.core.signing import TimestampSigner, BadSignature
-from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Q, Count, Prefetch
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters.views import FilterMixin
@@ -33,14 +32,21 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ct import utils
-from ct.models import CONSURFModel, ConsurfJob, ProteinFastaDatabase, MultipleSequenceAlignment, StructureFile
+from ct import utils, counts, grade_cache, grade_filters, job_events, job_logs, responses, typeahead
+from ct.pagination import OptionalKeysetPagination
+from ct.models import CONSURFModel, ConsurfJob, ProteinFastaDatabase, MultipleSequenceAlignment, StructureFile, \
+    ConsurfResidue
 from ct.serializers import CONSURFModelSerializer, ProteinFastaDatabaseSerializer, ConsurfJobSerializer, UserSerializer, \
-    MultipleSequenceAlignmentSerializer, StructureFileSerializer
+    MultipleSequenceAlignmentSerializer, StructureFileSerializer, ConsurfResidueSerializer, ConsurfJobSummarySerializer
 from ct.tasks import run_consurf_job, build_blast_index, build_mmseqs_index
 import django_rq
 
 
+def shared_with_prefetch():
+    """Load the users a resource is shared with in one query per page, for the serializers' shared_with fields."""
+    return Prefetch('shared_with', queryset=User.objects.only('id', 'username'))
+
+
 class DataChunkedUploadView(ChunkedUploadView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser,)
@@ -139,23 +145,86 @@ class CONSURFModelViewSet(viewsets.ModelViewSet):
 
 
 
+    def perform_create(self, serializer):
+        consurf = serializer.save()
+        if consurf.consurf_grade:
+            ConsurfResidue.objects.index_consurf(consurf)
+
+    def perform_update(self, serializer):
+        consurf = serializer.save()
+        if consurf.consurf_grade:
+            ConsurfResidue.objects.index_consurf(consurf)
+
     @action(permission_classes=[AllowAny], detail=False, methods=['get'], url_path='consurf_grade/(?P<uniprot_accession>[^/.]+)')
     def consurf_grade(self, request, uniprot_accession=None):
         if uniprot_accession is None:
             return Response()
+        try:
+            grade_filter = grade_filters.parse_grade_filter(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         consurf = CONSURFModel.objects.get(uniprot_accession=uniprot_accession)
-        df = utils.read_consurf_grade_file(consurf.consurf_grade.path)
-        df.fillna("", inplace=True)
-        return Response(df.to_dict(orient="records"))
+        df = grade_cache.read_cached("grade", consurf.consurf_grade.path)
+        return responses.per_residue_response(request, grade_filters.apply_grade_filter(df, grade_filter))
+
+    @action(permission_classes=[AllowAny], detail=False, methods=['get', 'post'])
+    def consurf_grade_batch(self, request):
+        """
+        Return the grades of many accessions in one request, given as a list in the "accessions" field of the body
+        or comma separated in ?accessions=. Accessions are resolved with a single query, their files are loaded
+        concurrently and one NDJSON line is streamed per accession in the order they were asked for, with an
+        error for the ones that are not found. The residue window and filters of consurf_grade apply to every item.
+        """
+        if request.method == 'POST':
+            accessions = request.data.get("accessions")
+        else:
+            accessions = [a for a in request.query_params.get("accessions", "").split(",") if a]
+        if not isinstance(accessions, list) or not all(isinstance(a, str) for a in accessions):
+            return Response({'error': 'accessions must be a list of uniprot accessions'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        accessions = list(dict.fromkeys(a.strip() for a in accessions if a.strip()))
+        if not accessions:
+            return Response({'error': 'accessions is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(accessions) > settings.CONSURF_BATCH_MAX_ACCESSIONS:
+            return Response({'error': f'at most {settings.CONSURF_BATCH_MAX_ACCESSIONS} accessions per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        layout = request.query_params.get("layout", "records")
+        if layout not in ("records", "columns"):
+            return Response({'error': 'layout must be records or columns'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            grade_filter = grade_filters.parse_grade_filter(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paths = {
+            consurf.uniprot_accession: consurf.consurf_grade.path
+            for consurf in CONSURFModel.objects.filter(uniprot_accession__in=accessions).only(
+                "id", "uniprot_accession", "consurf_grade")
+            if consurf.consurf_grade
+        }
+
+        def results():
+            found = grade_cache.read_cached_many("grade", ((a, paths[a]) for a in accessions if a in paths))
+            for accession in accessions:
+                if accession in paths:
+                    accession, df, error = next(found)
+                    if error is not None:
+                        yield accession, None, "grade file could not be read"
+                    else:
+                        yield accession, grade_filters.apply_grade_filter(df, grade_filter), None
+                else:
+                    yield accession, None, "not found"
+
+        return StreamingHttpResponse(responses.iter_batch_ndjson(results(), layout),
+                                     content_type="application/x-ndjson")
 
     @action(permission_classes=[AllowAny], detail=False, methods=['get'], url_path='consurf_msa_variation/(?P<uniprot_accession>[^/.]+)')
     def consurf_msa_variation(self, request, uniprot_accession=None):
         if uniprot_accession is None:
             return Response()
         consurf = CONSURFModel.objects.get(uniprot_accession=uniprot_accession)
-        df = utils.read_consurf_msa_variation_file(consurf.consurf_msa_variation.path)
-        df.fillna("", inplace=True)
-        return Response(df.to_dict(orient="records"))
+        df = grade_cache.read_cached("msa_variation", consurf.consurf_msa_variation.path)
+        return responses.per_residue_response(request, df)
 
     @action(permission_classes=[AllowAny], detail=False, methods=['get'], url_path='files/msa/(?P<uniprot_accession>[^/.]+)')
     def consurf_msa_file(self, request, uniprot_accession=None):
@@ -164,33 +233,93 @@ class CONSURFModelViewSet(viewsets.ModelViewSet):
         consurf = CONSURFModel.objects.get(uniprot_accession=uniprot_accession)
         return sendfile(request, consurf.msa.path, mimetype="text/plain", attachment=True, attachment_filename=f"{consurf.uniprot_accession}_consurf_msa.txt")
 
+    @action(permission_classes=[permissions.IsAdminUser], detail=False, methods=['get'])
+    def cache_stats(self, request):
+        return Response(grade_cache.stats())
+
     @action(permission_classes=[AllowAny], detail=False, methods=['get'])
     def count(self, request):
-        return Response(CONSURFModel.objects.count())
+        return Response(counts.count(CONSURFModel.objects.all()))
 
     @action(permission_classes=[AllowAny], detail=False, methods=['get'], url_path='typeahead/(?P<uniprot_accession>[^/.]+)')
     def consurf_typeahead(self, request, uniprot_accession=None):
         if uniprot_accession == "":
             return Response([])
-        consurf = CONSURFModel.objects.filter(uniprot_accession__startswith=uniprot_accession).order_by(
-            "uniprot_accession")[:10]
-        return Response([i.uniprot_accession for i in consurf])
+        return Response(typeahead.search(uniprot_accession))
+
+class ConsurfResidueViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Per-residue conservation across all precomputed proteins and the user's own jobs. Accepts uniprot_accession
+    as a comma separated list, job, low_confidence and the pos_from, pos_to, color, be and function filters of
+    the grade endpoints, color being matched against the grade.
+    """
+    queryset = ConsurfResidue.objects.all()
+    serializer_class = ConsurfResidueSerializer
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        user_id = self.request.user.id
+        query = Q(job__isnull=True)
+        if user_id:
+            query |= Q(job__user_id=user_id)
+        if self.action == "retrieve":
+            # the filters only narrow down lists, a residue is looked up by its id alone
+            return self.queryset.filter(query)
+        grade_filter = grade_filters.parse_grade_filter(self.request.query_params)
+        accessions = self.request.query_params.get("uniprot_accession")
+        if accessions:
+            query &= Q(uniprot_accession__in=[a for a in accessions.split(",") if a])
+        job = self.request.query_params.get("job")
+        if job:
+            query &= Q(job_id=job)
+        low_confidence = self.request.query_params.get("low_confidence")
+        if low_confidence in ("true", "false"):
+            query &= Q(low_confidence=low_confidence == "true")
+        if grade_filter.pos_from is not None:
+            query &= Q(pos__gte=grade_filter.pos_from)
+        if grade_filter.pos_to is not None:
+            query &= Q(pos__lte=grade_filter.pos_to)
+        if grade_filter.colors:
+            query &= Q(grade__in=grade_filter.colors)
+        if grade_filter.be:
+            query &= Q(be__in=grade_filter.be)
+        if grade_filter.function:
+            query &= Q(function__in=grade_filter.function)
+        return self.queryset.filter(query)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def counts(self, request):
+        """Number of matching residues per accession, most matches first."""
+        try:
+            queryset = self.get_queryset()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        rows = queryset.order_by().values("uniprot_accession").annotate(count=Count("id")).order_by(
+            "-count", "uniprot_accession")
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(rows)
 
 class ProteinFastaDatabaseViewSet(viewsets.ModelViewSet):
     queryset = ProteinFastaDatabase.objects.all()
     serializer_class = ProteinFastaDatabaseSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, JSONParser)
+    pagination_class = OptionalKeysetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['name']
     ordering = ['id']
     ordering_fields = ['id', 'name', 'uploaded_at']
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        query = Q()
-        query &= (Q(user_id=user_id) | Q(is_public=True) | Q(shared_with__id=user_id))
-        return self.queryset.filter(query).distinct().order_by('id')
+        return self.queryset.accessible_to(self.request.user).order_by('id').prefetch_related(shared_with_prefetch())
 
     def create(self, request, *args, **kwargs):
         upload_id = request.data.get("upload_id")
@@ -278,14 +407,12 @@ class MultipleSequenceAlignmentViewSet(viewsets.ModelViewSet):
     serializer_class = MultipleSequenceAlignmentSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, JSONParser)
+    pagination_class = OptionalKeysetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['name']
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        query = Q()
-        query &= (Q(user_id=user_id) | Q(is_public=True) | Q(shared_with__id=user_id))
-        return self.queryset.filter(query).distinct()
+        return self.queryset.accessible_to(self.request.user).prefetch_related(shared_with_prefetch())
 
     def create(self, request, *args, **kwargs):
         upload_id = request.data.get("upload_id")
@@ -358,14 +485,12 @@ class StructureFileViewSet(viewsets.ModelViewSet):
     serializer_class = StructureFileSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, JSONParser)
+    pagination_class = OptionalKeysetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['name']
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        query = Q()
-        query &= (Q(user_id=user_id) | Q(is_public=True) | Q(shared_with__id=user_id))
-        return self.queryset.filter(query).distinct()
+        return self.queryset.accessible_to(self.request.user).prefetch_related(shared_with_prefetch())
 
     def create(self, request, *args, **kwargs):
         upload_id = request.data.get("upload_id")
@@ -435,11 +560,16 @@ class StructureFileViewSet(viewsets.ModelViewSet):
         response['X-Accel-Redirect'] = f'/media/{structure.structure_file.name}'
         return response
 
+# text columns of ConsurfJob that hold the process output, served by the log action instead of the job list
+JOB_OUTPUT_FIELDS = ('log_data', 'error_data', 'process_cmd')
+
+
 class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
     queryset = ConsurfJob.objects.all()
     serializer_class = ConsurfJobSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = (MultiPartParser, JSONParser)
+    pagination_class = OptionalKeysetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['job_title', 'uniprot_accession']
 
@@ -451,7 +581,61 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
         status = self.request.query_params.get("status", None)
         if status:
             query &= Q(status=status)
-        return self.queryset.filter(query)
+        queryset = self.queryset.filter(query)
+        if self.action == 'list':
+            queryset = queryset.defer(*JOB_OUTPUT_FIELDS)
+        elif self.action == 'log':
+            queryset = queryset.only('id', 'user_id', 'status', *self.log_fields())
+        elif self.action == 'log_file':
+            queryset = queryset.only('id', 'user_id', 'status', *job_logs.STREAM_FIELDS.values())
+        return queryset
+
+    def log_fields(self):
+        field = self.request.query_params.get('field')
+        return [field] if field in JOB_OUTPUT_FIELDS else list(JOB_OUTPUT_FIELDS)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ConsurfJobSummarySerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=['get'])
+    def log(self, request, pk=None):
+        """
+        The process output of a job, left out of the job list. ?field=log_data or error_data returns only one. For
+        jobs that write their logs to disk these hold the tail, the whole log is served by log_file.
+        """
+        field = request.query_params.get('field')
+        if field and field not in JOB_OUTPUT_FIELDS:
+            return Response({'error': f'field must be one of {", ".join(JOB_OUTPUT_FIELDS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        job = self.get_object()
+        return Response({'id': job.id, 'status': job.status, **{f: getattr(job, f) for f in self.log_fields()}})
+
+    @action(permission_classes=[permissions.IsAdminUser], detail=False, methods=['get'])
+    def message_stats(self, request):
+        return Response(job_events.stats())
+
+    @action(detail=True, methods=['get'])
+    def log_file(self, request, pk=None):
+        """
+        The stdout or stderr log of a job given by ?stream=, whole or as the byte range of a Range header, or the
+        last ?lines= lines of it.
+        """
+        stream = request.query_params.get('stream', 'stdout')
+        if stream not in job_logs.STREAM_FIELDS:
+            return Response({'error': f'stream must be one of {", ".join(job_logs.STREAM_FIELDS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        lines = request.query_params.get('lines')
+        if lines is not None and (not lines.isdigit() or int(lines) == 0):
+            return Response({'error': 'lines must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        job = self.get_object()
+        f = job_logs.open_log(job, stream)
+        if lines is None:
+            return responses.file_range_response(request, f, 'text/plain; charset=utf-8')
+        with f:
+            content = job_logs.tail_lines(f, job_logs.log_size(f), int(lines))
+        return HttpResponse(content, content_type='text/plain; charset=utf-8')
 
     def create(self, request, *args, **kwargs):
         #get contort_session_id from request headers
@@ -494,6 +678,12 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
         algorithm = data.get("algorithm", "HMMER")
         job_title = data.get("job_title")
         msa_id = data.get("msa_id", None)
+        reuse = data.get("reuse", True)
+        if reuse == "false":
+            reuse = False
+        elif reuse == "true":
+            reuse = True
+        reuse = bool(settings.CONSURF_JOB_RESULT_REUSE and reuse)
 
 
         consurf_job = ConsurfJob(
@@ -514,27 +704,18 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
             session_id=contort_session_id
         )
         if fasta_database_id:
-            fasta_database = ProteinFastaDatabase.objects.filter(
-                Q(id=fasta_database_id) &
-                (Q(user=request.user) | Q(is_public=True) | Q(shared_with=request.user))
-            ).first()
+            fasta_database = ProteinFastaDatabase.objects.accessible_to(request.user).filter(id=fasta_database_id).first()
             if not fasta_database:
                 return Response({'error': 'FASTA database not found or not accessible'}, status=status.HTTP_404_NOT_FOUND)
             consurf_job.fasta_database = fasta_database
         if msa_id:
-            msa = MultipleSequenceAlignment.objects.filter(
-                Q(id=msa_id) &
-                (Q(user=request.user) | Q(is_public=True) | Q(shared_with=request.user))
-            ).first()
+            msa = MultipleSequenceAlignment.objects.accessible_to(request.user).filter(id=msa_id).first()
             if not msa:
                 return Response({'error': 'MSA not found or not accessible'}, status=status.HTTP_404_NOT_FOUND)
             consurf_job.msa = msa
             consurf_job.alignment_program = None
         if structure_id and chain:
-            structure = StructureFile.objects.filter(
-                Q(id=structure_id) &
-                (Q(user=request.user) | Q(is_public=True) | Q(shared_with=request.user))
-            ).first()
+            structure = StructureFile.objects.accessible_to(request.user).filter(id=structure_id).first()
             if not structure:
                 return Response({'error': 'Structure file not found or not accessible'}, status=status.HTTP_404_NOT_FOUND)
             consurf_job.structure_file = structure
@@ -542,9 +723,11 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
         if query_name:
             consurf_job.query_name = query_name
         consurf_job.save()
-        rq_job = run_consurf_job.delay(consurf_job.id, contort_session_id)
+        # the worker hashes the inputs and reuses the outputs of an identical earlier job unless asked not to
+        rq_job = run_consurf_job.delay(consurf_job.id, contort_session_id, reuse)
         consurf_job.rq_job_id = rq_job.id
-        consurf_job.save()
+        # the worker can already have completed a reused job, a full save would put it back to pending
+        consurf_job.save(update_fields=['rq_job_id'])
         return Response(ConsurfJobSerializer(consurf_job).data)
 
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
@@ -564,7 +747,15 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
             return Response({'error': 'Invalid or expired token'}, status=status.HTTP_400_BAD_REQUEST)
         job: ConsurfJob = get_object_or_404(ConsurfJob, pk=job_id)
 
-        if file_type == 'zip':
+        if file_type == 'member':
+            member_name = request.query_params.get('member')
+            if not member_name:
+                return Response({'error': 'member is required'}, status=status.HTTP_400_BAD_REQUEST)
+            zip_path = os.path.join(settings.MEDIA_ROOT, 'consurf_jobs', str(job_id), 'Consurf_Outputs.zip')
+            if not os.path.exists(zip_path):
+                return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+            return responses.zip_member_response(request, zip_path, member_name)
+        elif file_type == 'zip':
             file_name = 'Consurf_Outputs.zip'
         elif file_type == 'msa_aa_variety_percentage':
             file_name = 'msa_aa_variety_percentage.csv'
@@ -592,26 +783,45 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
         response['X-Accel-Redirect'] = f'/media/consurf_jobs/{job_id}/{file_name}'
         return response
 
+    @action(detail=True, methods=['get'])
+    def zip_members(self, request, pk=None):
+        """
+        List the members of the job's Consurf_Outputs.zip, or stream the one given by ?name= without
+        extracting the archive. Stored members honour Range requests.
+        """
+        job = self.get_object()
+        zip_path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id), "Consurf_Outputs.zip")
+        if not os.path.exists(zip_path):
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        member_name = request.query_params.get('name')
+        if member_name:
+            return responses.zip_member_response(request, zip_path, member_name)
+        return Response(responses.zip_member_list(zip_path))
+
     @action(permission_classes=[AllowAny], detail=True, methods=['get'])
     def consurf_grade(self, request, pk=None):
+        try:
+            grade_filter = grade_filters.parse_grade_filter(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         job = self.get_object()
-        path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id), "no_model_consurf_grades.txt")
-        if not os.path.exists(path):
-            for file in os.listdir(os.path.join(settings.MEDIA_ROOT, 'consurf_jobs', str(job.id))):
-                if file.endswith('_consurf_grades.txt'):
-                    path = os.path.join(settings.MEDIA_ROOT, 'consurf_jobs', str(job.id), file)
-                    break
-        df = utils.read_consurf_grade_file_new(path)
-        df.fillna("", inplace=True)
-        return Response(df.to_dict(orient="records"))
+        job_path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id))
+        try:
+            # structure jobs name the grades file after the structure, it is then looked up in the archive
+            df = grade_cache.read_cached_job_file("grade_new", job_path)
+        except FileNotFoundError:
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        return responses.per_residue_response(request, grade_filters.apply_grade_filter(df, grade_filter))
 
     @action(permission_classes=[AllowAny], detail=True, methods=['get'])
     def consurf_msa_variation(self, request, pk=None):
         job = self.get_object()
-        path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id), "msa_aa_variety_percentage.csv")
-        df = utils.read_consurf_msa_variation_file(path)
-        df.fillna("", inplace=True)
-        return Response(df.to_dict(orient="records"))
+        job_path = os.path.join(settings.MEDIA_ROOT, "consurf_jobs", str(job.id))
+        try:
+            df = grade_cache.read_cached_job_file("msa_variation", job_path)
+        except FileNotFoundError:
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+        return responses.per_residue_response(request, df)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def cancel(self, request, pk=None):
@@ -639,24 +849,17 @@ class ConsurfJobViewSet(viewsets.ModelViewSet, FilterMixin):
 
             job_path = os.path.join(settings.MEDIA_ROOT, 'consurf_jobs', str(job.id))
             if os.path.exists(job_path):
+                grade_cache.invalidate_directory(job_path)
                 shutil.rmtree(job_path)
 
             if job.session_id:
                 channel = get_channel_layer()
-                async_to_sync(channel.group_send)(
-                    f'job_{job.session_id}',
-                    {
-                        'type': 'job_message',
-                        'message': {
-                            'job_id': job.id,
-                            'status': 'cancelled',
-                            'session_id': job.session_id,
-                            'log_data': '',
-                            'error_data': '',
-                            'message': 'Job cancelled'
-                        }
-                    }
-                )
+                job_events.send(channel, job.session_id, {
+                    'job_id': job.id,
+                    'status': 'cancelled',
+                    'session_id': job.session_id,
+                    'message': 'Job cancelled'
+                })
 
             return Response({'message': 'Job cancelled successfully and folder cleaned up', 'status': job.status})
         except Exception as e: